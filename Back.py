@@ -1,19 +1,43 @@
-import json
+import argparse
 import logging
-from azure.identity import ClientSecretCredential
-from azure.mgmt.subscription import SubscriptionClient
-from azure.mgmt.recoveryservicesbackup import RecoveryServicesBackupClient
-from azure.mgmt.recoveryservices import RecoveryServicesClient
-from azure.mgmt.compute import ComputeManagementClient
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from azure_context import AzureContext
+from instrumentation import PROFILER
+from sharding import DEFAULT_PARTIAL_DIR, add_shard_arguments, read_partials, run_sharded, write_partial
+from snapshot_store import DEFAULT_MAX_AGE_HOURS, IncompleteRows, collect_with_snapshot, open_store, plan_refresh
+from vm_inventory import load_vm_inventory, lookup_vm, normalize_id
+from row_pipeline import FORMATS, ordered_map, output_path, sink_for, table_schema, write_table
 logging.basicConfig(
    level=logging.INFO,
    format='%(asctime)s - %(levelname)s - %(message)s',
    handlers=[logging.FileHandler("backup_report_log.txt", encoding='utf-8')]
 )
-def normalize_id(rid: str) -> str:
-   return rid.lower().replace(" ", "") if rid else ""
+DEFAULT_MAX_WORKERS = 8
+# Version of the row layout kept in snapshots and shard partials
+SNAPSHOT_ROW_FORMAT = 1
+# Protected items, VM power state and policy edits are not tracked by
+# resourcechanges, so incremental runs relist vaults, protected items and VMs
+# every time and only reuse parsed policies while these resources are unchanged
+# (and for at most snapshotMaxAgeHours).
+BACKUP_RESOURCE_TYPES = [
+   "Microsoft.RecoveryServices/vaults",
+   "Microsoft.Compute/virtualMachines"
+]
+BACKUP_HEADERS = [
+   "Name of the Resource", "Subscription", "Resource Group", "VM Status", "Operating System Type", "Operating System Version",
+   "RSV", "Policy Name", "Policy Tier", "Schedule", "Instant Snapshot", "Daily Retention",
+   "Weekly Retention", "Monthly Retention", "Yearly Retention", "Tiering"
+]
+# Typed layout for --format csv/parquet: retention counts instead of "30 Days"
+BACKUP_COLUMNS = [
+   ("Name of the Resource", "string"), ("Subscription", "string"), ("Resource Group", "string"),
+   ("VM Status", "string"), ("Operating System Type", "string"), ("Operating System Version", "string"),
+   ("RSV", "string"), ("Policy Name", "string"), ("Policy Tier", "string"), ("Schedule", "string"),
+   ("Instant Snapshot Days", "int"), ("Daily Retention Days", "int"), ("Weekly Retention Weeks", "int"),
+   ("Monthly Retention Months", "int"), ("Yearly Retention Years", "int"), ("Tiering", "bool")
+]
 def get_vm_info(compute_client, resource_group, resource_name):
    os_type, os_version, status = "-", "-", "-"
    try:
@@ -33,162 +57,300 @@ def get_vm_info(compute_client, resource_group, resource_name):
    except Exception as e:
        logging.warning(f"Could not get VM info for '{resource_name}': {e}")
    return os_type, os_version, status
-def run_backup():
-   config_file = "conf.json"
+class PolicyCache:
+   # Policies are listed once per vault and the parsed 10-column summary is
+   # memoized, keyed by (subscription, vault, policy name).
+   def __init__(self):
+       self._raw = {}
+       self._summaries = {}
+       self._seeded_vaults = set()
+       self._lock = threading.Lock()
+       self.hits = 0
+       self.misses = 0
+   @staticmethod
+   def _key(vault, policy_name):
+       return (vault.id.split('/')[2].lower(), vault.name.lower(), policy_name.lower())
+   def seed(self, subscription_id, records):
+       # records: parsed summaries saved by a previous run, see records()
+       for summary in records:
+           vault_name, policy_name = summary[0], summary[1]
+           self._summaries[(subscription_id.lower(), vault_name.lower(), policy_name.lower())] = summary
+           self._seeded_vaults.add((subscription_id.lower(), vault_name.lower()))
+   def records(self, subscription_id):
+       with self._lock:
+           return [
+               (f"{key[1]}/{key[2]}", summary) for key, summary in self._summaries.items()
+               if key[0] == subscription_id.lower()
+           ]
+   def load_vault(self, backup_client, vault, resource_group):
+       # Policies missing from a seeded vault are still fetched one by one in get_summary.
+       if (vault.id.split('/')[2].lower(), vault.name.lower()) in self._seeded_vaults:
+           return
+       try:
+           policies = backup_client.backup_policies.list(
+               vault_name=vault.name,
+               resource_group_name=resource_group
+           )
+           for policy in policies:
+               self._raw[self._key(vault, policy.name)] = policy
+       except Exception as e:
+           logging.warning(f"Could not list policies for vault {vault.name}: {e}")
+   def get_summary(self, backup_client, vault, resource_group, policy_name):
+       key = self._key(vault, policy_name)
+       with self._lock:
+           summary = self._summaries.get(key)
+           if summary is not None:
+               self.hits += 1
+               return summary
+           self.misses += 1
+       policy = self._raw.get(key)
+       if policy is None:
+           policy = backup_client.protection_policies.get(
+               vault_name=vault.name,
+               resource_group_name=resource_group,
+               policy_name=policy_name
+           )
+       summary = summarize_policy(vault.name, policy_name, policy)
+       with self._lock:
+           self._summaries[key] = summary
+       return summary
+def summarize_policy(vault_name, policy_name, policy):
+   policy_tier = "Standard"
+   schedule = "-"
+   instant_snapshot = "-"
+   daily_retention = "-"
+   weekly_retention = "-"
+   monthly_retention = "-"
+   yearly_retention = "-"
+   tiering = "No"
+   policy_props = policy.properties
+   if getattr(policy_props, 'instant_recovery_policy', None):
+       policy_tier = "Enhanced"
+   elif policy_name and "Enhanced" in policy_name:
+       policy_tier = "Enhanced"
+   schedule_policy = getattr(policy_props, 'schedule_policy', None)
+   if schedule_policy:
+       freq = getattr(schedule_policy, 'schedule_run_frequency', None)
+       if freq == "Daily" and hasattr(schedule_policy, 'schedule_run_times') and schedule_policy.schedule_run_times:
+           time_val = schedule_policy.schedule_run_times[0].strftime("%H:%M UTC")
+           schedule = f"Daily at {time_val}"
+       elif freq == "Weekly":
+           days = getattr(schedule_policy, 'schedule_days_of_week', [])
+           times = getattr(schedule_policy, 'schedule_run_times', [])
+           if days and times:
+               time_val = times[0].strftime("%H:%M UTC")
+               days_str = ", ".join(days)
+               schedule = f"Weekly on {days_str} at {time_val}"
+           elif days:
+               days_str = ", ".join(days)
+               schedule = f"Weekly on {days_str}"
+           elif times:
+               time_val = times[0].strftime("%H:%M UTC")
+               schedule = f"Weekly at {time_val}"
+           else:
+               schedule = "Weekly"
+       else:
+           schedule = freq or "-"
+   instant_snapshot_days = getattr(policy_props, 'instant_rp_retention_range_in_days', None)
+   if instant_snapshot_days is not None:
+       instant_snapshot = f"{instant_snapshot_days} Days"
+   retention_policy = getattr(policy_props, 'retention_policy', None)
+   if retention_policy:
+       if hasattr(retention_policy, 'daily_schedule') and retention_policy.daily_schedule and retention_policy.daily_schedule.retention_duration:
+           daily_retention = f"{retention_policy.daily_schedule.retention_duration.count} Days"
+       if hasattr(retention_policy, 'weekly_schedule') and retention_policy.weekly_schedule and retention_policy.weekly_schedule.retention_duration:
+           weekly_retention = f"{retention_policy.weekly_schedule.retention_duration.count} Weeks"
+       if hasattr(retention_policy, 'monthly_schedule') and retention_policy.monthly_schedule and retention_policy.monthly_schedule.retention_duration:
+           monthly_retention = f"{retention_policy.monthly_schedule.retention_duration.count} Months"
+       if hasattr(retention_policy, 'yearly_schedule') and retention_policy.yearly_schedule and retention_policy.yearly_schedule.retention_duration:
+           yearly_retention = f"{retention_policy.yearly_schedule.retention_duration.count} Years"
+   if getattr(policy_props, 'tiering_policy', None):
+       tiering = "Yes"
+   return [
+       vault_name, policy_name, policy_tier, schedule, instant_snapshot,
+       daily_retention, weekly_retention, monthly_retention, yearly_retention, tiering
+   ]
+def parse_protected_item(backup_client, vault, resource_group, protected_item, policy_cache):
+   source_resource_id = getattr(protected_item.properties, 'source_resource_id', None)
+   if not source_resource_id:
+       return None
+   policy_id = getattr(protected_item.properties, 'policy_id', None)
+   policy_name = policy_id.split('/')[-1] if policy_id else None
+   if not policy_name:
+       return None
+   return normalize_id(source_resource_id), policy_cache.get_summary(backup_client, vault, resource_group, policy_name)
+def name_and_group(resource_id):
+   parts = resource_id.split('/')
+   return (parts[-1], parts[4]) if len(parts) > 4 else (resource_id, "-")
+def failed_row(subscription, vault_name, resource_name="-", resource_group="-", resource_id=None):
+   # Stands in for a vault or protected item that could not be read; the error is logged.
+   return [resource_name, subscription.display_name, resource_group, "Lookup failed", "-", "-", vault_name,
+           *["-"] * (len(BACKUP_HEADERS) - 7), resource_id]
+def collect_vault(backup_client, vault, policy_cache):
+   # Returns the parsed items and (resource name, resource group, resource ID) of each failed lookup.
+   items = []
+   failures = []
+   try:
+       resource_group = vault.id.split('/')[4]
+       policy_cache.load_vault(backup_client, vault, resource_group)
+       protected_items = backup_client.backup_protected_items.list(
+           resource_group_name=resource_group,
+           vault_name=vault.name,
+           filter="backupManagementType eq 'AzureIaasVM'"
+       )
+       for protected_item in protected_items:
+           try:
+               item = parse_protected_item(backup_client, vault, resource_group, protected_item, policy_cache)
+               if item:
+                   items.append(item)
+           except Exception as inner_e:
+               logging.error(f"Error processing protected item '{protected_item.name}': {inner_e}")
+               source_id = getattr(protected_item.properties, 'source_resource_id', None)
+               failures.append((*name_and_group(source_id or protected_item.name), normalize_id(source_id) or None))
+   except Exception as vault_e:
+       logging.error(f"Error processing vault {vault.name}: {vault_e}")
+       failures.append(("-", name_and_group(vault.id)[1], None))
+   return items, failures
+def list_subscription_vaults(context, subscription):
+   from azure.mgmt.compute import ComputeManagementClient
+   from azure.mgmt.recoveryservices import RecoveryServicesClient
+   from azure.mgmt.recoveryservicesbackup import RecoveryServicesBackupClient
+   print(f"Processing subscription: {subscription.display_name}")
+   clients = {
+       "backup": context.client(RecoveryServicesBackupClient, subscription.subscription_id),
+       "compute": context.client(ComputeManagementClient, subscription.subscription_id)
+   }
+   load_vm_inventory(context.credential, subscription.subscription_id, clients["compute"])
+   try:
+       recovery_services_client = context.client(RecoveryServicesClient, subscription.subscription_id)
+       vaults = list(recovery_services_client.vaults.list_by_subscription_id())
+   except Exception as e:
+       logging.error(f"Error listing vaults for subscription {subscription.display_name}: {e}")
+       vaults = None
+   return clients, vaults
+def get_backed_up_vm_info(context, compute_client, res_id):
+   try:
+       parts = res_id.split('/')
+       resource_group = parts[4] if len(parts) > 4 else "-"
+       resource_name = parts[-1] if len(parts) > 0 else "-"
+   except Exception:
+       resource_group = "-"
+       resource_name = "-"
+   vm = lookup_vm(context.credential, res_id, **context.client_kwargs())
+   if vm is None:
+       # Inventory for the VM's subscription could not be listed; fall back to a direct lookup.
+       return resource_name, resource_group, get_vm_info(compute_client, resource_group, resource_name)
+   if not vm:
+       logging.warning(f"Could not get VM info for '{resource_name}': not found in VM inventory")
+       return resource_name, resource_group, ("-", "-", "-")
+   return resource_name, resource_group, (vm["os_type"], vm["os_version"], vm["status"])
+def collect_backup_rows(context, subscriptions, max_workers=DEFAULT_MAX_WORKERS, policy_cache=None):
+   # Subscriptions are listed a window ahead on one bounded pool; each one's
+   # vaults and VMs then fan out over the same pool and its rows are yielded
+   # before moving on, in the same order as a sequential walk.
+   policy_cache = policy_cache or PolicyCache()
+   with ThreadPoolExecutor(max_workers=max_workers) as executor:
+       listed = ordered_map(executor, lambda s: list_subscription_vaults(context, s), subscriptions, max_workers)
+       for subscription, (clients, vaults) in zip(subscriptions, listed):
+           if vaults is None:
+               print(f"⚠️ Could not list vaults in {subscription.display_name}; see backup_report_log.txt")
+               yield IncompleteRows([failed_row(subscription, "-")], failures=1)
+               continue
+           backup_info_cache = {}
+           failed = []
+           for vault, (items, failures) in zip(vaults, executor.map(lambda vault: collect_vault(clients["backup"], vault, policy_cache), vaults)):
+               for res_id, info in items:
+                   backup_info_cache[res_id] = info
+               failed += [failed_row(subscription, vault.name, *failure) for failure in failures]
+           vm_infos = executor.map(lambda res_id: get_backed_up_vm_info(context, clients["compute"], res_id), backup_info_cache)
+           # The normalized resource ID trails each row for the coverage join; it isn't written to the report.
+           rows = [
+               [resource_name, subscription.display_name, resource_group, status, os_type, os_version, *info, res_id]
+               for (res_id, info), (resource_name, resource_group, (os_type, os_version, status)) in zip(backup_info_cache.items(), vm_infos)
+           ]
+           if not failed:
+               yield rows
+               continue
+           print(f"⚠️ {len(failed)} backup lookups failed in {subscription.display_name}; see backup_report_log.txt")
+           yield IncompleteRows(rows + failed, failures=len(failed))
+   logging.info(f"Policy cache: {policy_cache.hits} hits, {policy_cache.misses} misses")
+def collect_backup(context, subscriptions, store=None, max_workers=DEFAULT_MAX_WORKERS):
+   if store is None:
+       return collect_backup_rows(context, subscriptions, max_workers)
+   # Every subscription is collected; the snapshot only supplies the parsed
+   # policies of subscriptions whose vaults and VMs haven't changed.
+   max_age_hours = context.config.get("snapshotMaxAgeHours", DEFAULT_MAX_AGE_HOURS)
+   stale_policies = plan_refresh(store, "backup_policies", context, subscriptions, BACKUP_RESOURCE_TYPES,
+                                 max_age_hours, SNAPSHOT_ROW_FORMAT)
+   policy_cache = PolicyCache()
+   for sub in subscriptions:
+       if sub.subscription_id.lower() not in stale_policies:
+           policy_cache.seed(sub.subscription_id, store.load_records("backup_policies", sub.subscription_id))
+   logging.info(f"[backup] Reusing parsed policies of {len(subscriptions) - len(stale_policies)} of {len(subscriptions)} subscriptions")
+   run_started = datetime.now(timezone.utc)
+   def collect(subs):
+       for sub, rows in zip(subs, collect_backup_rows(context, subs, max_workers, policy_cache)):
+           if sub.subscription_id.lower() in stale_policies and not isinstance(rows, IncompleteRows):
+               store.save_records("backup_policies", sub.subscription_id, "policy", policy_cache.records(sub.subscription_id),
+                                  run_started, SNAPSHOT_ROW_FORMAT)
+           yield rows
+   return collect_with_snapshot(
+       store, "backup", "protected_item", context, subscriptions, collect,
+       record_key=lambda row: f"{row[2]}/{row[0]}",
+       row_format=SNAPSHOT_ROW_FORMAT,
+       stale={sub.subscription_id.lower() for sub in subscriptions}
+   )
+def backup_report_rows(rows_by_subscription, coverage=None):
+   width = len(BACKUP_HEADERS)
+   for rows in rows_by_subscription:
+       for row in rows:
+           if coverage is not None and row[width]:
+               coverage.add_backup(row[width], row[0], row[1], row[2], row[6], row[7], lookup_failed=row[3] == "Lookup failed")
+           yield row[:width]
+def export_backup(rows_by_subscription, output_file, fmt="xlsx", coverage=None):
+   output_file = output_path(output_file, fmt)
+   headers, types = table_schema(fmt, BACKUP_HEADERS, BACKUP_COLUMNS)
+   sink = sink_for(output_file)
+   write_table(sink, "Backup Sheet", headers, backup_report_rows(rows_by_subscription, coverage), types)
+   sink.close()
+   if coverage is not None:
+       coverage.finish("backup")
+   print(f"\n✅ Backup report saved and formatted successfully as '{output_file}' 🎉")
+def run_backup(config_file="conf.json", max_workers=None, context=None, incremental=False, output_file="backup_report.xlsx", fmt="xlsx",
+               shard=None, merge=False, partial_dir=DEFAULT_PARTIAL_DIR, coverage=None):
+   if merge:
+       with PROFILER.stage("backup.merge"):
+           export_backup(read_partials(partial_dir, "backup", SNAPSHOT_ROW_FORMAT), output_file, fmt, coverage)
+       return
    try:
-       with open(config_file, "r") as f:
-           config = json.load(f)
-           tenant_id = config.get("tenantId")
-           client_id = config.get("clientId")
-           client_secret = config.get("clientSecret")
+       context = context or AzureContext.from_config(config_file)
+       max_workers = max_workers or context.config.get("maxWorkers", DEFAULT_MAX_WORKERS)
    except Exception as e:
        logging.critical(f"Failed to read '{config_file}': {e}")
        return
-   credential = ClientSecretCredential(
-       tenant_id=tenant_id,
-       client_id=client_id,
-       client_secret=client_secret
-   )
-   subscription_client = SubscriptionClient(credential)
-   wb = Workbook()
-   backup_sheet = wb.active
-   backup_sheet.title = "Backup Sheet"
-   BACKUP_HEADERS = [
-       "Name of the Resource", "Subscription", "Resource Group", "VM Status", "Operating System Type", "Operating System Version",
-       "RSV", "Policy Name", "Policy Tier", "Schedule", "Instant Snapshot", "Daily Retention",
-       "Weekly Retention", "Monthly Retention", "Yearly Retention", "Tiering"
-   ]
-   backup_sheet.append(BACKUP_HEADERS)
    logging.info("Starting backup collection... 💾")
-   for subscription in subscription_client.subscriptions.list():
-       subscription_name = subscription.display_name
-       print(f"Processing subscription: {subscription_name}")
-       recovery_services_client = RecoveryServicesClient(credential, subscription.subscription_id)
-       backup_client = RecoveryServicesBackupClient(credential, subscription.subscription_id)
-       compute_client = ComputeManagementClient(credential, subscription.subscription_id)
-       backup_info_cache = {}
-       try:
-           vaults = recovery_services_client.vaults.list_by_subscription_id()
-           for vault in vaults:
-               try:
-                   resource_group = vault.id.split('/')[4]
-                   protected_items = backup_client.backup_protected_items.list(
-                       resource_group_name=resource_group,
-                       vault_name=vault.name,
-                       filter="backupManagementType eq 'AzureIaasVM'"
-                   )
-                   for protected_item in protected_items:
-                       try:
-                           source_resource_id = getattr(protected_item.properties, 'source_resource_id', None)
-                           if not source_resource_id:
-                               continue
-                           policy_id = getattr(protected_item.properties, 'policy_id', None)
-                           policy_name = policy_id.split('/')[-1] if policy_id else None
-                           if not policy_name:
-                               continue
-                           policy = backup_client.protection_policies.get(
-                               vault_name=vault.name,
-                               resource_group_name=resource_group,
-                               policy_name=policy_name
-                           )
-                           policy_tier = "Standard"
-                           schedule = "-"
-                           instant_snapshot = "-"
-                           daily_retention = "-"
-                           weekly_retention = "-"
-                           monthly_retention = "-"
-                           yearly_retention = "-"
-                           tiering = "No"
-                           policy_props = policy.properties
-                           if getattr(policy_props, 'instant_recovery_policy', None):
-                               policy_tier = "Enhanced"
-                           elif policy_name and "Enhanced" in policy_name:
-                               policy_tier = "Enhanced"
-                           schedule_policy = getattr(policy_props, 'schedule_policy', None)
-                           if schedule_policy:
-                               freq = getattr(schedule_policy, 'schedule_run_frequency', None)
-                               if freq == "Daily" and hasattr(schedule_policy, 'schedule_run_times') and schedule_policy.schedule_run_times:
-                                   time_val = schedule_policy.schedule_run_times[0].strftime("%H:%M UTC")
-                                   schedule = f"Daily at {time_val}"
-                               elif freq == "Weekly":
-                                   days = getattr(schedule_policy, 'schedule_days_of_week', [])
-                                   times = getattr(schedule_policy, 'schedule_run_times', [])
-                                   if days and times:
-                                       time_val = times[0].strftime("%H:%M UTC")
-                                       days_str = ", ".join(days)
-                                       schedule = f"Weekly on {days_str} at {time_val}"
-                                   elif days:
-                                       days_str = ", ".join(days)
-                                       schedule = f"Weekly on {days_str}"
-                                   elif times:
-                                       time_val = times[0].strftime("%H:%M UTC")
-                                       schedule = f"Weekly at {time_val}"
-                                   else:
-                                       schedule = "Weekly"
-                               else:
-                                   schedule = freq or "-"
-                           instant_snapshot_days = getattr(policy_props, 'instant_rp_retention_range_in_days', None)
-                           if instant_snapshot_days is not None:
-                               instant_snapshot = f"{instant_snapshot_days} Days"
-                           retention_policy = getattr(policy_props, 'retention_policy', None)
-                           if retention_policy:
-                               if hasattr(retention_policy, 'daily_schedule') and retention_policy.daily_schedule and retention_policy.daily_schedule.retention_duration:
-                                   daily_retention = f"{retention_policy.daily_schedule.retention_duration.count} Days"
-                               if hasattr(retention_policy, 'weekly_schedule') and retention_policy.weekly_schedule and retention_policy.weekly_schedule.retention_duration:
-                                   weekly_retention = f"{retention_policy.weekly_schedule.retention_duration.count} Weeks"
-                               if hasattr(retention_policy, 'monthly_schedule') and retention_policy.monthly_schedule and retention_policy.monthly_schedule.retention_duration:
-                                   monthly_retention = f"{retention_policy.monthly_schedule.retention_duration.count} Months"
-                               if hasattr(retention_policy, 'yearly_schedule') and retention_policy.yearly_schedule and retention_policy.yearly_schedule.retention_duration:
-                                   yearly_retention = f"{retention_policy.yearly_schedule.retention_duration.count} Years"
-                           if getattr(policy_props, 'tiering_policy', None):
-                               tiering = "Yes"
-                           backup_info_cache[normalize_id(source_resource_id)] = [
-                               vault.name, policy_name, policy_tier, schedule, instant_snapshot,
-                               daily_retention, weekly_retention, monthly_retention, yearly_retention, tiering
-                           ]
-                       except Exception as inner_e:
-                           logging.error(f"Error processing protected item '{protected_item.name}': {inner_e}")
-                           continue
-               except Exception as vault_e:
-                   logging.error(f"Error processing vault {vault.name}: {vault_e}")
-                   continue
-       except Exception as e:
-           logging.error(f"Error listing vaults for subscription {subscription_name}: {e}")
-       for res_id, info in backup_info_cache.items():
-           try:
-               parts = res_id.split('/')
-               resource_group = parts[4] if len(parts) > 4 else "-"
-               resource_name = parts[-1] if len(parts) > 0 else "-"
-           except Exception:
-               resource_group = "-"
-               resource_name = "-"
-           os_type, os_version, status = get_vm_info(compute_client, resource_group, resource_name)
-           backup_sheet.append([resource_name, subscription_name, resource_group, status, os_type, os_version, *info])
-   output_file = "backup_report.xlsx"
-   wb.save(output_file)
-   # --- Styling with openpyxl ---
-   wb = load_workbook(output_file)
-   ws = wb.active
-   thin_border = Border(left=Side(style='thin'),
-                        right=Side(style='thin'),
-                        top=Side(style='thin'),
-                        bottom=Side(style='thin'))
-   header_fill = PatternFill(start_color="FF00FF", end_color="FF00FF", fill_type="solid")
-   header_font = Font(color="FFFFFF", bold=True, name="Calibri", size=12)
-   for col in ws.iter_cols(min_row=1, max_row=1, min_col=1, max_col=ws.max_column):
-       for cell in col:
-           cell.fill = header_fill
-           cell.font = header_font
-           cell.border = thin_border
-           cell.alignment = Alignment(horizontal='center', vertical='center')
-   data_font = Font(color="000000", name="Calibri", size=12)
-   data_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-   for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-       for cell in row:
-           cell.font = data_font
-           cell.fill = data_fill
-           cell.border = thin_border
-   wb.save(output_file)
-   print(f"\n✅ Backup report saved and formatted successfully as '{output_file}' 🎉")
+   store = open_store(context.config) if incremental else None
+   collect = lambda subscriptions: collect_backup(context, subscriptions, store, max_workers)
+   try:
+       if shard:
+           with PROFILER.stage("backup.shard"):
+               path, row_count = write_partial(partial_dir, "backup", shard, context.subscriptions, collect, SNAPSHOT_ROW_FORMAT)
+           print(f"✅ Shard {shard[0]}/{shard[1]}: {row_count} protected items written to {path}")
+       else:
+           # Rows are written as each subscription finishes, not after the whole estate.
+           with PROFILER.stage("backup.pipeline"):
+               export_backup(collect(context.subscriptions), output_file, fmt, coverage)
+   finally:
+       if store:
+           store.close()
 if __name__ == "__main__":
-   run_backup()
\ No newline at end of file
+   parser = argparse.ArgumentParser(description="Export Azure VM backup report")
+   parser.add_argument("--incremental", action="store_true", help="only refetch subscriptions changed since the last snapshot")
+   parser.add_argument("--format", choices=list(FORMATS), default="xlsx",
+                       help="xlsx: formatted workbook; csv/parquet: typed columns for downstream loads")
+   add_shard_arguments(parser)
+   parser.add_argument("--profile", default="run_profile.json", help="write the run profile (JSON) to this file")
+   parser.add_argument("--prometheus", help="also write the run profile in Prometheus text format to this file")
+   args = parser.parse_args()
+   run_sharded(run_backup, args, incremental=args.incremental, fmt=args.format)
+   PROFILER.write(args.profile, args.prometheus)
\ No newline at end of file
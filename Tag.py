@@ -1,13 +1,14 @@
-import json
+import argparse
 import logging
 import os
 import sys
-from azure.identity import ClientSecretCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.subscription import SubscriptionClient
-import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
+from azure_context import AzureContext, load_config
+from instrumentation import PROFILER
+from resource_graph import query_resource_graph
+from sharding import DEFAULT_PARTIAL_DIR, add_shard_arguments, read_partials, run_sharded, write_partial
+from snapshot_store import DEFAULT_MAX_AGE_HOURS, collect_with_snapshot, open_store
+from row_pipeline import FORMATS, chunked, output_path, peek_rows, sink_for, table_schema, write_table
+from tag_schema import DEFAULT_TAG_COLUMNS, ComplianceTally, compliance_schema, expand_tags, resource_frame
 # ------------------------ Logging Setup ------------------------
 log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log")
 os.makedirs(log_dir, exist_ok=True)
@@ -18,86 +19,162 @@ logging.basicConfig(
    encoding='utf-8'
 )
 # ------------------------ Main Function ------------------------
-def run_tagging(config_file="conf.json"):
+RESOURCE_GRAPH_QUERY = "resources | project id, name, type, location, subscriptionId, tags | order by subscriptionId asc, id asc"
+TAG_CHUNK_ROWS = 5000
+# Version of the row layout kept in snapshots and shard partials
+SNAPSHOT_ROW_FORMAT = 1
+def resource_type_from_id(resource_id, graph_type):
+   # Resource Graph lower-cases "type"; rebuild it from the ID so both backends
+   # match. Extension resources name their own type after the last "providers";
+   # anything that doesn't agree with Graph's type is left as Graph reports it.
+   parts = resource_id.split('/')
+   lowered = [p.lower() for p in parts]
+   if "providers" not in lowered:
+       return graph_type
+   provider = parts[len(lowered) - lowered[::-1].index("providers"):]
+   rebuilt = "/".join(provider[:1] + provider[1::2])
+   return rebuilt if rebuilt.lower() == (graph_type or "").lower() else graph_type
+def tagging_row(resource_id, name, resource_type, location, tags, subscription_name):
+   resource_group = resource_id.split('/')[4] if len(resource_id.split('/')) > 4 else "-"
+   return (resource_id, name, resource_type, resource_group, location, subscription_name, tags or {})
+def collect_subscription_resources(context, subscription):
+   # Only the arm backend needs the resource SDK, so it isn't imported up front.
+   from azure.mgmt.resource import ResourceManagementClient
+   print(f"🌐 Processing subscription: {subscription.display_name}...")
+   resource_client = context.client(ResourceManagementClient, subscription.subscription_id)
+   return [
+       tagging_row(resource.id, resource.name, resource.type, resource.location, resource.tags, subscription.display_name)
+       for resource in resource_client.resources.list()
+   ]
+def collect_arm_resources(context, subscriptions):
+   for subscription in subscriptions:
+       yield collect_subscription_resources(context, subscription)
+def collect_graph_resources(context, subscriptions):
+   # Results are ordered by subscription, and callers pass subscriptions sorted
+   # by ID, so each subscription is yielded as soon as its last row arrives.
+   print(f"🌐 Querying Resource Graph for {len(subscriptions)} subscriptions...")
+   index = {s.subscription_id.lower(): i for i, s in enumerate(subscriptions)}
+   names = {s.subscription_id.lower(): s.display_name for s in subscriptions}
+   position = 0
+   rows = []
+   for resource in query_resource_graph(context, RESOURCE_GRAPH_QUERY, [s.subscription_id for s in subscriptions]):
+       sub_id = resource["subscriptionId"].lower()
+       if index[sub_id] < position:
+           raise ValueError(f"Resource Graph returned subscription {sub_id} out of order")
+       while position < index[sub_id]:
+           yield rows
+           rows = []
+           position += 1
+       rows.append(tagging_row(
+           resource["id"], resource["name"], resource_type_from_id(resource["id"], resource["type"]),
+           resource["location"], resource.get("tags"), names[sub_id]
+       ))
+   for _ in range(position, len(subscriptions)):
+       yield rows
+       rows = []
+def collect_resources(context, subscriptions, backend):
+   done = 0
+   if backend == "graph" and subscriptions:
+       try:
+           for rows in collect_graph_resources(context, subscriptions):
+               yield rows
+               done += 1
+           return
+       except Exception as e:
+           logging.warning(f"⚠️ Resource Graph query failed, falling back to per-subscription listing "
+                           f"for {len(subscriptions) - done} subscriptions: {e}")
+   yield from collect_arm_resources(context, subscriptions[done:])
+def collect_tagging(context, subscriptions, store=None, backend="graph"):
+   # subscriptions must be sorted by ID for the Resource Graph backend
+   return collect_with_snapshot(
+       store, "tagging", "resource", context, subscriptions,
+       lambda subs: collect_resources(context, subs, backend),
+       record_key=lambda row: row[0],
+       max_age_hours=context.config.get("snapshotMaxAgeHours", DEFAULT_MAX_AGE_HOURS),
+       row_format=SNAPSHOT_ROW_FORMAT
+   )
+def report_columns(tag_columns):
+   # Existing Tags before individual tag columns
+   return ["Name", "Resource Type", "Resource Group", "Location", "Subscription", "Existing Tags", *tag_columns]
+def tag_report_rows(resources, tag_columns, tally, coverage=None):
+   # Tags are expanded a chunk at a time; only the compliance counts carry over.
+   cols = report_columns(tag_columns)
+   for chunk in chunked(resources, TAG_CHUNK_ROWS):
+       df = expand_tags(resource_frame(chunk), tag_columns)
+       tally.add(df)
+       if coverage is not None:
+           coverage.add_tags(df)
+       yield from df[cols].itertuples(index=False, name=None)
+def export_tagging(rows_by_subscription, tag_columns, output_file, fmt="xlsx", coverage=None):
+   resources = peek_rows(row for rows in rows_by_subscription for row in rows)
+   if resources is None:
+       logging.info("⚠️ No resources found to export.")
+       print("⚠️ No resources found to export.")
+       if coverage is not None:
+           coverage.finish("tagging")
+       return
+   output_file = output_path(output_file, fmt)
+   sink = sink_for(output_file)
+   tally = ComplianceTally(tag_columns)
+   cols = report_columns(tag_columns)
+   headers, types = table_schema(fmt, cols, [(c, "string") for c in cols])
+   write_table(sink, "Sheet1", headers, tag_report_rows(resources, tag_columns, tally, coverage), types)
+   compliance = tally.summary()
+   headers, types = table_schema(fmt, compliance.columns, compliance_schema(compliance))
+   write_table(sink, "Tag Compliance", headers, compliance.itertuples(index=False, name=None), types)
+   sink.close()
+   if coverage is not None:
+       coverage.finish("tagging")
+   logging.info(f"✅ Tagging report exported to {output_file} 🎉")
+   print(f"✅ Tagging report exported to {output_file} 🎉")
+def run_tagging(config_file="conf.json", context=None, incremental=False, backend="graph", output_file=None, fmt="xlsx",
+                shard=None, merge=False, partial_dir=DEFAULT_PARTIAL_DIR, coverage=None):
+   output_file = output_file or os.path.join(os.path.dirname(os.path.abspath(__file__)), "Tagging-Sheet.xlsx")
+   if merge:
+       config = context.config if context else load_config(config_file)
+       with PROFILER.stage("tagging.merge"):
+           export_tagging(read_partials(partial_dir, "tagging", SNAPSHOT_ROW_FORMAT), config.get("tagColumns", DEFAULT_TAG_COLUMNS), output_file, fmt, coverage)
+       return
    try:
-       with open(config_file) as f:
-           config = json.load(f)
-       credential = ClientSecretCredential(
-           tenant_id=config['tenantId'],
-           client_id=config['clientId'],
-           client_secret=config['clientSecret']
-       )
+       context = context or AzureContext.from_config(config_file)
        logging.info("🔑 Authentication successful!")
        print("🔑 Authentication successful!")
    except Exception as e:
        logging.critical(f"❌ Authentication failed: {e}")
        print(f"❌ Authentication failed: {e}")
        sys.exit(1)
-   subscription_client = SubscriptionClient(credential)
-   tagging_data = []
-   for subscription in subscription_client.subscriptions.list():
-       print(f"🌐 Processing subscription: {subscription.display_name}...")
-       resource_client = ResourceManagementClient(credential, subscription.subscription_id)
-       for resource in resource_client.resources.list():
-           tags = resource.tags or {}
-           existing_tags = "; ".join([f"{k}: {v}" for k, v in tags.items()]) if tags else "-"
-           tagging_data.append({
-               "Name": resource.name,
-               "Resource Type": resource.type,
-               "Resource Group": resource.id.split('/')[4] if len(resource.id.split('/')) > 4 else "-",
-               "Location": resource.location,
-               "Subscription": subscription.display_name,
-               "Existing Tags": existing_tags,
-               "Environment": tags.get("Environment", "-"),
-               "Application": tags.get("Application", "-"),
-               "Owner": tags.get("Owner", "-"),
-               "Owner Email": tags.get("Owner Email", "-"),
-               "Comments": tags.get("Comments", "-")
-           })
-   if tagging_data:
-       df = pd.DataFrame(tagging_data)
-       # Reorder columns: Existing Tags before individual tag columns
-       cols = ["Name", "Resource Type", "Resource Group", "Location", "Subscription",
-               "Existing Tags", "Environment", "Application", "Owner", "Owner Email", "Comments"]
-       df = df[cols]
-       output_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Tagging-Sheet.xlsx")
-       df.to_excel(output_file, index=False)
-       # ---------------- Table Styling ----------------
-       wb = load_workbook(output_file)
-       ws = wb.active
-       thin_border = Border(
-           left=Side(style='thin'),
-           right=Side(style='thin'),
-           top=Side(style='thin'),
-           bottom=Side(style='thin')
-       )
-       # Header styling
-       header_fill = PatternFill(start_color="FF00FF", end_color="FF00FF", fill_type="solid")
-       header_font = Font(color="FFFFFF", bold=True, name="Calibri", size=12)
-       for col in ws.iter_cols(min_row=1, max_row=1, min_col=1, max_col=ws.max_column):
-           for cell in col:
-               cell.fill = header_fill
-               cell.font = header_font
-               cell.border = thin_border
-               cell.alignment = Alignment(horizontal='center', vertical='center')
-       # Data row styling
-       data_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-       data_font = Font(color="000000", name="Calibri", size=12)
-       for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-           for cell in row:
-               cell.fill = data_fill
-               cell.font = data_font
-               cell.border = thin_border
-       wb.save(output_file)
-       logging.info(f"✅ Tagging report exported to {output_file} 🎉")
-       print(f"✅ Tagging report exported to {output_file} 🎉")
-   else:
-       logging.info("⚠️ No resources found to export.")
-       print("⚠️ No resources found to export.")
+   store = open_store(context.config) if incremental else None
+   tag_columns = context.config.get("tagColumns", DEFAULT_TAG_COLUMNS)
+   subscriptions = sorted(context.subscriptions, key=lambda s: s.subscription_id.lower())
+   collect = lambda subscriptions: collect_tagging(context, subscriptions, store, backend)
+   try:
+       if shard:
+           with PROFILER.stage("tagging.shard"):
+               path, row_count = write_partial(partial_dir, "tagging", shard, subscriptions, collect, SNAPSHOT_ROW_FORMAT)
+           logging.info(f"✅ Shard {shard[0]}/{shard[1]}: {row_count} resources written to {path}")
+           print(f"✅ Shard {shard[0]}/{shard[1]}: {row_count} resources written to {path}")
+       else:
+           # Collection, tag extraction and writing are one streamed stage.
+           with PROFILER.stage("tagging.pipeline"):
+               export_tagging(collect(subscriptions), tag_columns, output_file, fmt, coverage)
+   finally:
+       if store:
+           store.close()
 # ------------------------ Entry Point ------------------------
 if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Export Azure resource tags")
+   parser.add_argument("--incremental", action="store_true", help="only refetch subscriptions changed since the last snapshot")
+   parser.add_argument("--backend", choices=["graph", "arm"], default="graph",
+                       help="graph: batched Resource Graph queries; arm: per-subscription resources.list()")
+   parser.add_argument("--format", choices=list(FORMATS), default="xlsx",
+                       help="xlsx: formatted workbook; csv/parquet: typed columns for downstream loads")
+   add_shard_arguments(parser)
+   parser.add_argument("--profile", default="run_profile.json", help="write the run profile (JSON) to this file")
+   parser.add_argument("--prometheus", help="also write the run profile in Prometheus text format to this file")
+   args = parser.parse_args()
    print("✨ Running Tagging Script...")
    logging.info("✨ Running Tagging Script...")
-   run_tagging()
+   run_sharded(run_tagging, args, incremental=args.incremental, backend=args.backend, fmt=args.format)
+   PROFILER.write(args.profile, args.prometheus)
    print("🌟 Tagging Script finished.")
    logging.info("🌟 Tagging Script finished.")
\ No newline at end of file
@@ -0,0 +1,81 @@
+import json
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.pipeline.transport import RequestsTransport
+from instrumentation import InstrumentationPolicy, PROFILER
+from request_scheduler import RequestScheduler, SchedulerRetryPolicy
+# One credential (and its in-memory token cache), one pooled HTTP session and
+# one subscription list, shared by every collector running in this process.
+ARM_SCOPE = "https://management.azure.com/.default"
+DEFAULT_POOL_SIZE = 32
+def load_config(config_file="conf.json"):
+   with open(config_file, "r") as f:
+       return json.load(f)
+def create_transport(pool_size=DEFAULT_POOL_SIZE):
+   session = requests.Session()
+   # Retries are left to the azure-core pipeline, as RequestsTransport does for its own sessions.
+   adapter = HTTPAdapter(
+       pool_connections=pool_size,
+       pool_maxsize=pool_size,
+       max_retries=Retry(total=False, redirect=False, raise_on_status=False)
+   )
+   session.mount("https://", adapter)
+   session.mount("http://", adapter)
+   return RequestsTransport(session=session, session_owner=False)
+class AzureContext:
+   def __init__(self, config, credential=None, transport=None):
+       self.config = config
+       pool_size = max(DEFAULT_POOL_SIZE, 4 * int(config.get("maxWorkers", 8)))
+       self.transport = transport or create_transport(pool_size)
+       if credential is None:
+           from azure.identity import ClientSecretCredential
+           credential = ClientSecretCredential(
+               tenant_id=config['tenantId'],
+               client_id=config['clientId'],
+               client_secret=config['clientSecret'],
+               transport=self.transport
+           )
+       self.credential = credential
+       self.scheduler = RequestScheduler.from_config(config)
+       self.timings = {}
+       self._subscriptions = None
+       self._lock = threading.Lock()
+   @classmethod
+   def from_config(cls, config_file="conf.json"):
+       return cls(load_config(config_file))
+   def client_kwargs(self):
+       # Policies are chained per pipeline, so each client gets its own instance.
+       return {
+           "transport": self.transport,
+           "retry_policy": SchedulerRetryPolicy(self.scheduler),
+           "per_retry_policies": [InstrumentationPolicy()]
+       }
+   def client(self, client_class, *args):
+       return client_class(self.credential, *args, **self.client_kwargs())
+   def authenticate(self):
+       start = time.perf_counter()
+       with PROFILER.stage("auth"):
+           self.credential.get_token(ARM_SCOPE)
+       self.timings["auth"] = time.perf_counter() - start
+       logging.info("🔑 Authentication successful!")
+   @property
+   def subscriptions(self):
+       with self._lock:
+           if self._subscriptions is None:
+               start = time.perf_counter()
+               with PROFILER.stage("subscriptions"):
+                   from azure.mgmt.subscription import SubscriptionClient
+                   subscription_client = self.client(SubscriptionClient)
+                   self._subscriptions = list(subscription_client.subscriptions.list())
+               self.timings["subscriptions"] = time.perf_counter() - start
+               logging.info(f"Found {len(self._subscriptions)} subscriptions")
+           return self._subscriptions
+   def refresh_subscriptions(self):
+       # Long-running callers re-list so new or removed subscriptions are picked up.
+       with self._lock:
+           self._subscriptions = None
+       return self.subscriptions
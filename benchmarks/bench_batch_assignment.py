@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+from patch import note_schedule, schedule_batches
+# Compares the previous iterrows + per-schedule DataFrame filter batch ordering
+# with the streaming numbering the report uses (note_schedule on each row, then
+# schedule_batches over the first row of each schedule) on a synthetic estate.
+WEEKS = ["First", "Second", "Third", "Fourth", "Last"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+def synthetic_rows(vm_count, schedule_count, seed=7):
+   rng = random.Random(seed)
+   base = datetime(2024, 1, 1)
+   schedules = [
+       (f"mc-{i}", f"{rng.choice(WEEKS)} {rng.choice(DAYS)} of the month", base + timedelta(minutes=30 * rng.randrange(48)))
+       for i in range(schedule_count)
+   ]
+   rows = []
+   for i in range(vm_count):
+       if i % 10 == 0:
+           rows.append({"Maintenance Schedule Name": "-", "Patching Day": "-", "_start_datetime": None})
+       else:
+           name, day, start = schedules[rng.randrange(schedule_count)]
+           rows.append({"Maintenance Schedule Name": name, "Patching Day": day, "_start_datetime": start})
+   return rows
+def legacy_week_order(patch_day_str):
+   week_map = {"First": 1, "Second": 2, "Third": 3, "Fourth": 4, "Last": 5}
+   for k, v in week_map.items():
+       if patch_day_str.startswith(k):
+           return v
+   return 99
+def legacy_assign_batches(df):
+   schedule_start_map = {}
+   for _, row in df.iterrows():
+       sched = row["Maintenance Schedule Name"]
+       start_dt = row["_start_datetime"]
+       if sched != "-" and sched not in schedule_start_map:
+           schedule_start_map[sched] = start_dt
+   schedule_order_list = sorted(
+       schedule_start_map.keys(),
+       key=lambda x: (legacy_week_order(df[df["Maintenance Schedule Name"] == x]["Patching Day"].iloc[0]),
+                      schedule_start_map[x])
+   )
+   batch_map = {name: f"Batch {i+1}" for i, name in enumerate(schedule_order_list)}
+   return df["Maintenance Schedule Name"].map(batch_map).fillna("-")
+def streaming_assign_batches(rows):
+   first_seen = {}
+   for row in rows:
+       note_schedule(first_seen, row)
+   batches = schedule_batches(first_seen.values())
+   return [batches.get(row["Maintenance Schedule Name"], "-") for row in rows]
+def timed(func, data):
+   start = time.perf_counter()
+   result = func(data)
+   return result, time.perf_counter() - start
+def main():
+   parser = argparse.ArgumentParser(description="Benchmark patch batch assignment")
+   parser.add_argument("--vms", type=int, default=100_000)
+   parser.add_argument("--schedules", type=int, default=2_000)
+   parser.add_argument("--skip-legacy", action="store_true")
+   args = parser.parse_args()
+   rows = synthetic_rows(args.vms, args.schedules)
+   result = {"vms": args.vms, "schedules": args.schedules}
+   streaming, result["streaming_s"] = timed(streaming_assign_batches, rows)
+   if not args.skip_legacy:
+       legacy, result["legacy_s"] = timed(legacy_assign_batches, pd.DataFrame(rows))
+       result["identical"] = legacy.tolist() == streaming
+   print(json.dumps({k: round(v, 3) if isinstance(v, float) else v for k, v in result.items()}))
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+# Runs run_tagging, run_backup and get_azure_update_manager_data end to end
+# against fake_azure at several estate sizes, one interpreter per run, and
+# reports API calls, wall time and peak RSS as JSON.
+COLLECTORS = ["tagging", "backup", "patching"]
+def run_worker(collector, vm_count, latency, page_size):
+   with tempfile.TemporaryDirectory() as tmp:
+       os.chdir(tmp)
+       from fake_azure import FakeEstate, install
+       import Tag, Back, patch
+       estate = FakeEstate(vm_count, latency=latency, page_size=page_size)
+       context = install(estate)
+       runners = {
+           "tagging": lambda: Tag.run_tagging(context=context, output_file=os.path.join(tmp, "Tagging-Sheet.xlsx")),
+           "backup": lambda: Back.run_backup(context=context),
+           "patching": lambda: patch.get_azure_update_manager_data("conf.json", context=context)
+       }
+       start = time.perf_counter()
+       runners[collector]()
+       wall = time.perf_counter() - start
+   return {
+       "collector": collector,
+       "vms": vm_count,
+       "subscriptions": len(estate.subscriptions),
+       "latency_ms": latency * 1000,
+       "page_size": page_size,
+       "wall_s": round(wall, 3),
+       # ru_maxrss is reported in kilobytes on Linux
+       "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+       "api_calls": sum(estate.calls.values()),
+       "api_calls_by_operation": dict(sorted(estate.calls.items()))
+   }
+def main():
+   parser = argparse.ArgumentParser(description="Offline end-to-end collector benchmark")
+   parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000, 50_000])
+   parser.add_argument("--collectors", nargs="+", default=COLLECTORS, choices=COLLECTORS)
+   parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency per API call / page")
+   parser.add_argument("--page-size", type=int, default=100)
+   parser.add_argument("--output", help="write the JSON results to this file")
+   parser.add_argument("--worker", choices=COLLECTORS, help=argparse.SUPPRESS)
+   args = parser.parse_args()
+   if args.worker:
+       result = run_worker(args.worker, args.sizes[0], args.latency_ms / 1000, args.page_size)
+       sys.stdout.write("\n" + json.dumps(result) + "\n")
+       return
+   results = []
+   for vm_count in args.sizes:
+       for collector in args.collectors:
+           output = subprocess.run(
+               [sys.executable, os.path.abspath(__file__), "--worker", collector, "--sizes", str(vm_count),
+                "--latency-ms", str(args.latency_ms), "--page-size", str(args.page_size)],
+               check=True, capture_output=True, text=True
+           ).stdout
+           result = json.loads(output.strip().splitlines()[-1])
+           results.append(result)
+           print(f"{collector:<9} {vm_count:>7} VMs  {result['api_calls']:>7} calls  "
+                 f"{result['wall_s']:>8.2f}s  {result['peak_rss_mb']:>8.1f} MB", file=sys.stderr)
+   report = json.dumps(results, indent=2)
+   if args.output:
+       with open(args.output, "w") as f:
+           f.write(report)
+   print(report)
+if __name__ == "__main__":
+   main()
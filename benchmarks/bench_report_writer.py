@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Compares the old to_excel + load_workbook + restyle cycle with the streaming
+# report_writer.ExcelSink, and with the columnar --format outputs (csv,
+# parquet). Each measurement runs in its own interpreter so peak RSS is per
+# approach.
+HEADERS = ["Name", "Resource Type", "Resource Group", "Location", "Subscription",
+           "Existing Tags", "Environment", "Application", "Owner", "Owner Email", "Comments"]
+def synthetic_rows(count):
+   for i in range(count):
+       yield (
+           f"resource-{i}", "Microsoft.Compute/virtualMachines", f"rg-{i % 200}", "eastus",
+           f"subscription-{i % 50}", f"Environment: prod; Owner: team-{i % 30}", "prod",
+           f"app-{i % 80}", f"team-{i % 30}", f"team-{i % 30}@example.com", "-"
+       )
+def write_legacy(output_file, count):
+   import pandas as pd
+   from openpyxl import load_workbook
+   from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
+   df = pd.DataFrame(list(synthetic_rows(count)), columns=HEADERS)
+   df.to_excel(output_file, index=False)
+   wb = load_workbook(output_file)
+   ws = wb.active
+   thin_border = Border(left=Side(style='thin'),
+                        right=Side(style='thin'),
+                        top=Side(style='thin'),
+                        bottom=Side(style='thin'))
+   header_fill = PatternFill(start_color="FF00FF", end_color="FF00FF", fill_type="solid")
+   header_font = Font(color="FFFFFF", bold=True, name="Calibri", size=12)
+   for col in ws.iter_cols(min_row=1, max_row=1, min_col=1, max_col=ws.max_column):
+       for cell in col:
+           cell.fill = header_fill
+           cell.font = header_font
+           cell.border = thin_border
+           cell.alignment = Alignment(horizontal='center', vertical='center')
+   data_font = Font(color="000000", name="Calibri", size=12)
+   data_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
+   for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
+       for cell in row:
+           cell.font = data_font
+           cell.fill = data_fill
+           cell.border = thin_border
+   wb.save(output_file)
+def write_sink(output_file, count, fmt):
+   # The same path the collectors use: row_pipeline sinks fed by write_table
+   from row_pipeline import output_path, sink_for, write_table
+   sink = sink_for(output_path(output_file, fmt))
+   types = None if fmt == "xlsx" else ["string"] * len(HEADERS)
+   write_table(sink, "Sheet1", HEADERS, synthetic_rows(count), types)
+   sink.close()
+WRITERS = {
+   "legacy": write_legacy,
+   "streaming": lambda output_file, count: write_sink(output_file, count, "xlsx"),
+   "csv": lambda output_file, count: write_sink(output_file, count, "csv"),
+   "parquet": lambda output_file, count: write_sink(output_file, count, "parquet")
+}
+def run_worker(writer, count):
+   with tempfile.TemporaryDirectory() as tmp:
+       start = time.perf_counter()
+       WRITERS[writer](os.path.join(tmp, "report.xlsx"), count)
+       wall = time.perf_counter() - start
+   # ru_maxrss is reported in kilobytes on Linux
+   peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+   print(json.dumps({"writer": writer, "rows": count, "wall_s": round(wall, 3), "peak_rss_mb": round(peak_rss_mb, 1)}))
+def main():
+   parser = argparse.ArgumentParser(description="Benchmark report writers")
+   parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+   parser.add_argument("--writers", nargs="+", default=list(WRITERS), choices=list(WRITERS))
+   parser.add_argument("--worker", choices=list(WRITERS), help=argparse.SUPPRESS)
+   args = parser.parse_args()
+   if args.worker:
+       run_worker(args.worker, args.rows[0])
+       return
+   results = []
+   for count in args.rows:
+       for writer in args.writers:
+           output = subprocess.run(
+               [sys.executable, os.path.abspath(__file__), "--worker", writer, "--rows", str(count)],
+               check=True, capture_output=True, text=True
+           ).stdout
+           result = json.loads(output.strip().splitlines()[-1])
+           results.append(result)
+           print(f"{writer:<10} {count:>8} rows  {result['wall_s']:>8.2f}s  {result['peak_rss_mb']:>8.1f} MB")
+   print(json.dumps(results, indent=2))
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cold import cost of each entry point, measured with python -X importtime in
+# a fresh interpreter per run. Reports the script's cumulative import time,
+# its heaviest direct imports and which heavy dependencies were loaded.
+SCRIPTS = ["Tag", "Back", "patch", "main"]
+WATCHED = ["pandas", "numpy", "openpyxl", "pyarrow", "azure.identity", "azure.mgmt"]
+def parse_importtime(stderr):
+   # "import time: self [us] | cumulative | imported package", indented two spaces per level
+   entries = []
+   for line in stderr.splitlines():
+       if not line.startswith("import time:") or "imported package" in line:
+           continue
+       _, cumulative, name = line[len("import time:"):].split("|")
+       depth = (len(name) - len(name.lstrip()) - 1) // 2
+       entries.append((name.strip(), int(cumulative), depth))
+   return entries
+def measure(script):
+   # Run from a scratch directory so import-time side effects (log files) stay out of the repo.
+   env = dict(os.environ, PYTHONPATH=ROOT)
+   with tempfile.TemporaryDirectory() as tmp:
+       start = time.perf_counter()
+       result = subprocess.run(
+           [sys.executable, "-X", "importtime", "-c", f"import {script}"],
+           cwd=tmp, env=env, capture_output=True, text=True, check=True
+       )
+       wall = time.perf_counter() - start
+   entries = parse_importtime(result.stderr)
+   total, depth = next((cumulative, depth) for name, cumulative, depth in entries if name == script)
+   # Children are listed before their parent; direct imports sit one level deeper than the script.
+   index = next(i for i, (name, _, _) in enumerate(entries) if name == script)
+   children = []
+   for name, cumulative, child_depth in reversed(entries[:index]):
+       if child_depth <= depth:
+           break
+       if child_depth == depth + 1:
+           children.append((name, cumulative))
+   loaded = sorted({
+       watched for name, _, _ in entries for watched in WATCHED
+       if name == watched or name.startswith(watched + ".")
+   })
+   return total, wall, children, loaded
+def main():
+   parser = argparse.ArgumentParser(description="Benchmark entry point import time")
+   parser.add_argument("--scripts", nargs="+", default=SCRIPTS, choices=SCRIPTS)
+   parser.add_argument("--repeat", type=int, default=5)
+   parser.add_argument("--top", type=int, default=5, help="heaviest direct imports to report per script")
+   parser.add_argument("--output", help="also write the results as JSON to this file")
+   args = parser.parse_args()
+   results = []
+   for script in args.scripts:
+       runs = [measure(script) for _ in range(args.repeat)]
+       children = sorted(runs[-1][2], key=lambda item: item[1], reverse=True)[:args.top]
+       result = {
+           "script": script,
+           "import_ms": round(statistics.median(run[0] for run in runs) / 1000, 1),
+           "process_ms": round(statistics.median(run[1] for run in runs) * 1000, 1),
+           "heaviest_imports_ms": {name: round(cumulative / 1000, 1) for name, cumulative in children},
+           "loaded": runs[-1][3]
+       }
+       results.append(result)
+       print(f"{script:<8} import {result['import_ms']:>8.1f} ms  process {result['process_ms']:>8.1f} ms  "
+             f"loaded: {', '.join(result['loaded']) or '-'}")
+   print(json.dumps(results, indent=2))
+   if args.output:
+       with open(args.output, "w") as f:
+           json.dump(results, f, indent=2)
+if __name__ == "__main__":
+   main()
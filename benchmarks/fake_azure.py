@@ -0,0 +1,264 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+from azure.mgmt.maintenance.models import MaintenanceConfiguration
+# In-process stand-in for the Azure management SDK clients used by the
+# collectors. Every page served counts as one API call and sleeps for the
+# configured latency, so call counts and wall time behave like the real tenant.
+WEEKS = ["First", "Second", "Third", "Fourth", "Last"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+class FakeAzureError(Exception):
+   pass
+class FakeEstate:
+   def __init__(self, vm_count, vms_per_subscription=250, vaults_per_subscription=2, policies_per_vault=3,
+                configs_per_subscription=4, latency=0.0, page_size=100, graph_page_size=None, failures=None):
+       self.vm_count = vm_count
+       self.vms_per_subscription = vms_per_subscription
+       self.vaults_per_subscription = vaults_per_subscription
+       self.policies_per_vault = policies_per_vault
+       self.configs_per_subscription = configs_per_subscription
+       self.latency = latency
+       self.page_size = page_size
+       # Resource Graph may return fewer rows per page than requested; None keeps "top"
+       self.graph_page_size = graph_page_size
+       # operation name -> number of calls that succeed before every later one fails
+       self.failures = dict(failures or {})
+       self.calls = Counter()
+       self._lock = threading.Lock()
+       subscription_count = max(1, -(-vm_count // vms_per_subscription))
+       self.subscriptions = [
+           SimpleNamespace(subscription_id=f"00000000-0000-0000-0000-{i:012d}", display_name=f"Subscription {i}")
+           for i in range(subscription_count)
+       ]
+   # --- estate shape -------------------------------------------------------
+   def vm_indexes(self, subscription_id):
+       sub_index = self.subscription_index(subscription_id)
+       start = sub_index * self.vms_per_subscription
+       return range(start, min(self.vm_count, start + self.vms_per_subscription))
+   def subscription_index(self, subscription_id):
+       return int(subscription_id.rsplit("-", 1)[-1])
+   def vm_id(self, subscription_id, i):
+       return f"/subscriptions/{subscription_id}/resourceGroups/rg-{i % 20}/providers/Microsoft.Compute/virtualMachines/vm-{i}"
+   def vault_id(self, subscription_id, v):
+       return f"/subscriptions/{subscription_id}/resourceGroups/rg-backup/providers/Microsoft.RecoveryServices/vaults/rsv-{v}"
+   def config_id(self, subscription_id, c):
+       return f"/subscriptions/{subscription_id}/resourceGroups/rg-patching/providers/Microsoft.Maintenance/maintenanceConfigurations/mc-{c}"
+   def is_backed_up(self, i):
+       return i % 5 != 0
+   def is_assigned(self, i):
+       return i % 10 < 7
+   # --- call accounting ----------------------------------------------------
+   def call(self, name):
+       with self._lock:
+           self.calls[name] += 1
+           count = self.calls[name]
+       if self.latency:
+           time.sleep(self.latency)
+       if name in self.failures and count > self.failures[name]:
+           raise FakeAzureError(f"{name} failed (simulated)")
+   def paged(self, name, items):
+       items = list(items)
+       for start in range(0, max(len(items), 1), self.page_size):
+           self.call(name)
+           yield from items[start:start + self.page_size]
+   # --- SDK-shaped objects -------------------------------------------------
+   def vm(self, subscription_id, i):
+       os_type = "Windows" if i % 3 == 0 else "Linux"
+       return SimpleNamespace(
+           id=self.vm_id(subscription_id, i),
+           name=f"vm-{i}",
+           type="Microsoft.Compute/virtualMachines",
+           location="eastus",
+           tags={"Environment": "prod", "Owner": f"team-{i % 30}"} if i % 4 else {},
+           storage_profile=SimpleNamespace(
+               os_disk=SimpleNamespace(os_type=os_type),
+               image_reference=SimpleNamespace(offer="WindowsServer" if os_type == "Windows" else "ubuntu-24_04-lts")
+           ),
+           instance_view=SimpleNamespace(
+               os_name="Windows Server 2022" if os_type == "Windows" else "ubuntu",
+               os_version="10.0.20348" if os_type == "Windows" else "24.04",
+               statuses=[SimpleNamespace(code="ProvisioningState/succeeded"),
+                         SimpleNamespace(code="PowerState/running" if i % 7 else "PowerState/deallocated")]
+           )
+       )
+   def resources(self, subscription_id):
+       for i in self.vm_indexes(subscription_id):
+           vm = self.vm(subscription_id, i)
+           yield vm
+           rg = vm.id.split('/')[4]
+           yield SimpleNamespace(
+               id=f"/subscriptions/{subscription_id}/resourceGroups/{rg}/providers/Microsoft.Compute/disks/vm-{i}-osdisk",
+               name=f"vm-{i}-osdisk", type="Microsoft.Compute/disks", location="eastus", tags=vm.tags
+           )
+           yield SimpleNamespace(
+               id=f"/subscriptions/{subscription_id}/resourceGroups/{rg}/providers/Microsoft.Network/networkInterfaces/vm-{i}-nic",
+               name=f"vm-{i}-nic", type="Microsoft.Network/networkInterfaces", location="eastus", tags=None
+           )
+   def policy(self, v, p):
+       return SimpleNamespace(
+           name=f"policy-{v}-{p}" + ("-Enhanced" if p == 0 else ""),
+           properties=SimpleNamespace(
+               instant_recovery_policy=None,
+               schedule_policy=SimpleNamespace(schedule_run_frequency="Daily", schedule_run_times=[datetime(2024, 1, 1, 2 + p)]),
+               instant_rp_retention_range_in_days=2,
+               retention_policy=SimpleNamespace(
+                   daily_schedule=SimpleNamespace(retention_duration=SimpleNamespace(count=30)),
+                   weekly_schedule=SimpleNamespace(retention_duration=SimpleNamespace(count=12)) if p else None,
+                   monthly_schedule=None,
+                   yearly_schedule=None
+               ),
+               tiering_policy=None
+           )
+       )
+   def protected_items(self, subscription_id, vault_name):
+       v = int(vault_name.rsplit("-", 1)[-1])
+       for i in self.vm_indexes(subscription_id):
+           if self.is_backed_up(i) and i % self.vaults_per_subscription == v:
+               p = i % self.policies_per_vault
+               yield SimpleNamespace(
+                   name=f"VM;iaasvmcontainerv2;vm-{i}",
+                   properties=SimpleNamespace(
+                       source_resource_id=self.vm_id(subscription_id, i),
+                       policy_id=f"{self.vault_id(subscription_id, v)}/backupPolicies/{self.policy(v, p).name}"
+                   )
+               )
+   def maintenance_config(self, subscription_id, c):
+       config = MaintenanceConfiguration(
+           location="eastus",
+           maintenance_scope="InGuestPatch",
+           start_date_time=f"2024-01-0{1 + c % 7} {c % 24:02d}:00",
+           duration="03:30",
+           time_zone="UTC",
+           recur_every=f"1Month {WEEKS[c % len(WEEKS)]} {DAYS[c % len(DAYS)]}"
+       )
+       config.__dict__["id"] = self.config_id(subscription_id, c)
+       config.__dict__["name"] = f"mc-{c}"
+       return config
+   def assignment(self, subscription_id, i):
+       return SimpleNamespace(
+           resource_id=self.vm_id(subscription_id, i),
+           maintenance_configuration_id=self.config_id(subscription_id, i % self.configs_per_subscription)
+       )
+   # --- client classes -----------------------------------------------------
+   def client_classes(self):
+       estate = self
+       class FakeSubscriptionClient:
+           def __init__(self, credential, **kwargs):
+               self.subscriptions = SimpleNamespace(list=lambda: estate.paged("subscriptions.list", estate.subscriptions))
+       class FakeResourceManagementClient:
+           def __init__(self, credential, subscription_id, **kwargs):
+               self.resources = SimpleNamespace(list=lambda: estate.paged("resources.list", estate.resources(subscription_id)))
+       class FakeResourceGraphClient:
+           def __init__(self, credential, **kwargs):
+               self._results = {}
+           def resources(self, request):
+               estate.call("resourcegraph.resources")
+               key = (request.query, tuple(request.subscriptions))
+               if key not in self._results:
+                   rows = []
+                   if request.query.startswith("resources"):
+                       for sub in request.subscriptions:
+                           for r in estate.resources(sub):
+                               rows.append({"id": r.id, "name": r.name, "type": r.type.lower(), "location": r.location,
+                                            "subscriptionId": sub, "tags": r.tags})
+                   self._results[key] = rows
+               rows = self._results[key]
+               start = int(request.options.skip_token or 0)
+               end = start + min(request.options.top or 1000, estate.graph_page_size or 1000)
+               return SimpleNamespace(data=rows[start:end], skip_token=str(end) if end < len(rows) else None)
+       class FakeComputeManagementClient:
+           def __init__(self, credential, subscription_id, **kwargs):
+               self.virtual_machines = SimpleNamespace(
+                   list_all=self._list_all,
+                   get=self._get
+               )
+               self.subscription_id = subscription_id
+           def _list_all(self, status_only=None):
+               vms = (estate.vm(self.subscription_id, i) for i in estate.vm_indexes(self.subscription_id))
+               if status_only:
+                   # Only the instance view is relied on from status-only listings.
+                   vms = (SimpleNamespace(id=vm.id, name=vm.name, location=vm.location, instance_view=vm.instance_view) for vm in vms)
+               return estate.paged("virtual_machines.list_all", vms)
+           def _get(self, resource_group_name, vm_name, expand=None):
+               estate.call("virtual_machines.get")
+               return estate.vm(self.subscription_id, int(vm_name.rsplit("-", 1)[-1]))
+       class FakeRecoveryServicesClient:
+           def __init__(self, credential, subscription_id, **kwargs):
+               self.vaults = SimpleNamespace(list_by_subscription_id=lambda: estate.paged("vaults.list_by_subscription_id", [
+                   SimpleNamespace(id=estate.vault_id(subscription_id, v), name=f"rsv-{v}")
+                   for v in range(estate.vaults_per_subscription)
+               ]))
+       class FakeRecoveryServicesBackupClient:
+           def __init__(self, credential, subscription_id, **kwargs):
+               self.backup_protected_items = SimpleNamespace(
+                   list=lambda vault_name, resource_group_name, filter=None: estate.paged(
+                       "backup_protected_items.list", estate.protected_items(subscription_id, vault_name))
+               )
+               self.backup_policies = SimpleNamespace(
+                   list=lambda vault_name, resource_group_name, filter=None: estate.paged(
+                       "backup_policies.list",
+                       [estate.policy(int(vault_name.rsplit("-", 1)[-1]), p) for p in range(estate.policies_per_vault)])
+               )
+               self.protection_policies = SimpleNamespace(get=self._get_policy)
+           def _get_policy(self, vault_name, resource_group_name, policy_name):
+               estate.call("protection_policies.get")
+               return estate.policy(int(vault_name.rsplit("-", 1)[-1]), int(policy_name.split("-")[2]))
+       class FakeMaintenanceManagementClient:
+           def __init__(self, credential, subscription_id, **kwargs):
+               self.subscription_id = subscription_id
+               self.maintenance_configurations = SimpleNamespace(
+                   list=lambda: estate.paged("maintenance_configurations.list", [
+                       estate.maintenance_config(subscription_id, c) for c in range(estate.configs_per_subscription)
+                   ]),
+                   get=self._get_config
+               )
+               self.configuration_assignments_within_subscription = SimpleNamespace(
+                   list=lambda: estate.paged("configuration_assignments_within_subscription.list", [
+                       estate.assignment(subscription_id, i) for i in estate.vm_indexes(subscription_id) if estate.is_assigned(i)
+                   ])
+               )
+               self.configuration_assignments = SimpleNamespace(list_parent=self._list_parent)
+           def _get_config(self, resource_group_name, resource_name):
+               estate.call("maintenance_configurations.get")
+               return estate.maintenance_config(self.subscription_id, int(resource_name.rsplit("-", 1)[-1]))
+           def _list_parent(self, resource_name, **kwargs):
+               i = int(resource_name.rsplit("-", 1)[-1])
+               assigned = [estate.assignment(self.subscription_id, i)] if estate.is_assigned(i) else []
+               return estate.paged("configuration_assignments.list_parent", assigned)
+       return {
+           "SubscriptionClient": FakeSubscriptionClient,
+           "ResourceManagementClient": FakeResourceManagementClient,
+           "ResourceGraphClient": FakeResourceGraphClient,
+           "ComputeManagementClient": FakeComputeManagementClient,
+           "RecoveryServicesClient": FakeRecoveryServicesClient,
+           "RecoveryServicesBackupClient": FakeRecoveryServicesBackupClient,
+           "MaintenanceManagementClient": FakeMaintenanceManagementClient
+       }
+class FakeCredential:
+   def get_token(self, *scopes, **kwargs):
+       return SimpleNamespace(token="fake", expires_on=int(time.time()) + 3600)
+SDK_MODULES = {
+   "SubscriptionClient": "azure.mgmt.subscription",
+   "ResourceManagementClient": "azure.mgmt.resource",
+   "ResourceGraphClient": "azure.mgmt.resourcegraph",
+   "ComputeManagementClient": "azure.mgmt.compute",
+   "RecoveryServicesClient": "azure.mgmt.recoveryservices",
+   "RecoveryServicesBackupClient": "azure.mgmt.recoveryservicesbackup",
+   "MaintenanceManagementClient": "azure.mgmt.maintenance"
+}
+def install(estate):
+   # Swap the SDK client classes, both in the SDK packages (the collectors
+   # import most clients where they use them) and where a module already
+   # bound one at import time.
+   import importlib
+   import azure_context, resource_graph, vm_inventory, Tag, Back, patch
+   classes = estate.client_classes()
+   for name, fake in classes.items():
+       setattr(importlib.import_module(SDK_MODULES[name]), name, fake)
+   for module in (azure_context, resource_graph, vm_inventory, Tag, Back, patch):
+       for name, fake in classes.items():
+           if hasattr(module, name):
+               setattr(module, name, fake)
+   return azure_context.AzureContext({"maxWorkers": 8}, credential=FakeCredential())
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from azure.core.pipeline.policies import HTTPPolicy
+# Run profile: per-operation and per-subscription API call counts, latency
+# histograms, throttling/retries and bytes, plus wall time per report stage.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+def operation_name(method, url):
+   # "/subscriptions/x/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/vm"
+   # becomes "GET /subscriptions/{}/resourceGroups/{}/providers/Microsoft.Compute/virtualMachines/{}"
+   parts = [p for p in urlparse(url).path.split('/') if p]
+   names = []
+   i = 0
+   while i < len(parts):
+       segment = parts[i]
+       if segment.lower() == "providers" and i + 1 < len(parts):
+           names += [segment, parts[i + 1]]
+           i += 2
+           continue
+       names.append(segment)
+       if i + 1 < len(parts):
+           names.append("{}")
+       i += 2
+   return f"{method} /" + "/".join(names)
+def subscription_from_url(url):
+   parts = [p for p in urlparse(url).path.split('/') if p]
+   if len(parts) > 1 and parts[0].lower() == "subscriptions":
+       return parts[1].lower()
+   return "-"
+def _new_stats():
+   return {
+       "calls": 0, "errors": 0, "throttled": 0, "retries": 0,
+       "total_s": 0.0, "max_s": 0.0,
+       "request_bytes": 0, "response_bytes": 0,
+       "histogram": [0] * (len(LATENCY_BUCKETS) + 1)
+   }
+class Profiler:
+   def __init__(self):
+       self._lock = threading.Lock()
+       self.reset()
+   def reset(self):
+       with self._lock:
+           self.started_at = datetime.now(timezone.utc)
+           self.operations = defaultdict(_new_stats)
+           self.subscriptions = defaultdict(_new_stats)
+           self.stages = defaultdict(lambda: {"count": 0, "total_s": 0.0})
+           self.counters = defaultdict(int)
+   def record_call(self, operation, subscription, seconds, status, request_bytes=0, response_bytes=0, retry=False):
+       bucket = next((i for i, limit in enumerate(LATENCY_BUCKETS) if seconds <= limit), len(LATENCY_BUCKETS))
+       with self._lock:
+           for stats in (self.operations[operation], self.subscriptions[subscription]):
+               stats["calls"] += 1
+               stats["total_s"] += seconds
+               stats["max_s"] = max(stats["max_s"], seconds)
+               stats["request_bytes"] += request_bytes
+               stats["response_bytes"] += response_bytes
+               stats["histogram"][bucket] += 1
+               if status is None or status >= 400:
+                   stats["errors"] += 1
+               if status == 429:
+                   stats["throttled"] += 1
+               if retry:
+                   stats["retries"] += 1
+   def increment(self, name, value=1):
+       with self._lock:
+           self.counters[name] += value
+   @contextmanager
+   def stage(self, name):
+       start = time.perf_counter()
+       try:
+           yield
+       finally:
+           elapsed = time.perf_counter() - start
+           with self._lock:
+               self.stages[name]["count"] += 1
+               self.stages[name]["total_s"] += elapsed
+   def to_dict(self):
+       def rows(table, key_name):
+           result = []
+           for key, stats in sorted(table.items()):
+               row = {key_name: key, **stats}
+               row["total_s"] = round(stats["total_s"], 4)
+               row["max_s"] = round(stats["max_s"], 4)
+               row["mean_s"] = round(stats["total_s"] / stats["calls"], 4) if stats["calls"] else 0.0
+               row["histogram"] = dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], stats["histogram"]))
+               result.append(row)
+           return result
+       with self._lock:
+           return {
+               "started_at": self.started_at.isoformat(),
+               "finished_at": datetime.now(timezone.utc).isoformat(),
+               "stages": {name: {"count": s["count"], "total_s": round(s["total_s"], 4)} for name, s in self.stages.items()},
+               "counters": dict(self.counters),
+               "operations": rows(self.operations, "operation"),
+               "subscriptions": rows(self.subscriptions, "subscription")
+           }
+   def to_prometheus(self):
+       def escape(value):
+           return str(value).replace("\\", "\\\\").replace('"', '\\"')
+       # Samples of one metric must be grouped together in the text format.
+       with self._lock:
+           operations = sorted(self.operations.items())
+           stages = sorted(self.stages.items())
+           lines = ["# TYPE azure_api_request_seconds histogram"]
+           for operation, stats in operations:
+               label = f'operation="{escape(operation)}"'
+               cumulative = 0
+               for limit, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], stats["histogram"]):
+                   cumulative += count
+                   lines.append(f'azure_api_request_seconds_bucket{{{label},le="{limit}"}} {cumulative}')
+               lines.append(f"azure_api_request_seconds_sum{{{label}}} {stats['total_s']:.6f}")
+               lines.append(f"azure_api_request_seconds_count{{{label}}} {stats['calls']}")
+           for metric, field in (("azure_api_errors_total", "errors"), ("azure_api_throttled_total", "throttled"),
+                                 ("azure_api_retries_total", "retries"), ("azure_api_response_bytes_total", "response_bytes"),
+                                 ("azure_api_request_bytes_total", "request_bytes")):
+               lines.append(f"# TYPE {metric} counter")
+               for operation, stats in operations:
+                   lines.append(f'{metric}{{operation="{escape(operation)}"}} {stats[field]}')
+           lines.append("# TYPE report_stage_seconds_total counter")
+           for name, stage in stages:
+               lines.append(f'report_stage_seconds_total{{stage="{escape(name)}"}} {stage["total_s"]:.6f}')
+       return "\n".join(lines) + "\n"
+   def write(self, json_file="run_profile.json", prometheus_file=None):
+       with open(json_file, "w", encoding="utf-8") as f:
+           json.dump(self.to_dict(), f, indent=2)
+       if prometheus_file:
+           with open(prometheus_file, "w", encoding="utf-8") as f:
+               f.write(self.to_prometheus())
+PROFILER = Profiler()
+def _response_size(http_response):
+   try:
+       length = http_response.headers.get("content-length")
+       return int(length) if length else len(http_response.body() or b"")
+   except Exception:
+       return 0
+class InstrumentationPolicy(HTTPPolicy):
+   # Installed after the retry policy, so every attempt (including throttled
+   # ones that get retried) is recorded separately.
+   def __init__(self, profiler=PROFILER):
+       super().__init__()
+       self.profiler = profiler
+   def send(self, request):
+       http_request = request.http_request
+       attempt = request.context.get("instrumentation_attempt", 0)
+       request.context["instrumentation_attempt"] = attempt + 1
+       body = http_request.body
+       request_bytes = len(body) if isinstance(body, (bytes, str)) else 0
+       start = time.perf_counter()
+       status = None
+       response_bytes = 0
+       try:
+           response = self.next.send(request)
+           status = response.http_response.status_code
+           response_bytes = _response_size(response.http_response)
+           return response
+       finally:
+           self.profiler.record_call(
+               operation_name(http_request.method, http_request.url),
+               subscription_from_url(http_request.url),
+               time.perf_counter() - start,
+               status,
+               request_bytes,
+               response_bytes,
+               retry=attempt > 0
+           )
@@ -0,0 +1,323 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from azure_context import AzureContext
+from instrumentation import PROFILER
+from snapshot_store import open_store
+from vm_inventory import expire_vm_inventory, normalize_id
+from raw_config_cache import RawConfigCache
+from row_pipeline import FORMATS, output_path
+from tag_schema import DEFAULT_TAG_COLUMNS
+from vm_coverage import DEFAULT_COVERAGE_FILE, CoverageIndex, write_coverage
+import Tag
+import Back
+import patch
+# Long-running mode: each collector refreshes on its own interval in a
+# background thread (incrementally, through the snapshot store), the rows are
+# kept in memory with hash indexes for lookups over a local HTTP API, and
+# reports are exported from memory on demand without calling Azure.
+DEFAULT_PORT = 8765
+DEFAULT_EXPORT_DIR = "exports"
+DEFAULT_REFRESH_MINUTES = {"tagging": 60, "backup": 360, "patching": 120}
+COLLECTORS = list(DEFAULT_REFRESH_MINUTES)
+EXPORT_FILES = {"tagging": "Tagging-Sheet.xlsx", "backup": "backup_report.xlsx", "patching": "Patching-Sheet.xlsx"}
+def now():
+   return datetime.now(timezone.utc).isoformat()
+def index_records(records, name_key):
+   # normalized resource ID -> record, lower-cased name -> records (names repeat across groups)
+   by_id, by_name = {}, {}
+   for record in records:
+       if record["Resource ID"]:
+           by_id[record["Resource ID"]] = record
+       by_name.setdefault(str(record[name_key]).lower(), []).append(record)
+   return {"id": by_id, "name": by_name}
+def tagging_indexes(rows_by_subscription):
+   records = [
+       {
+           "Resource ID": normalize_id(resource_id), "Name": name, "Resource Type": resource_type,
+           "Resource Group": resource_group, "Location": location, "Subscription": subscription, "Tags": tags
+       }
+       for rows in rows_by_subscription
+       for resource_id, name, resource_type, resource_group, location, subscription, tags in rows
+   ]
+   return index_records(records, "Name")
+def backup_indexes(rows_by_subscription):
+   width = len(Back.BACKUP_HEADERS)
+   records = [
+       {**dict(zip(Back.BACKUP_HEADERS, row)), "Resource ID": row[width]}
+       for rows in rows_by_subscription for row in rows
+   ]
+   return index_records(records, "Name of the Resource")
+def patching_indexes(rows_by_subscription):
+   first_seen = {}
+   for rows in rows_by_subscription:
+       for row in rows:
+           patch.note_schedule(first_seen, row)
+   batches = patch.schedule_batches(list(first_seen.values()))
+   records = []
+   schedules = {}
+   for rows in rows_by_subscription:
+       for row in rows:
+           record = {column: row[column] for column in patch.REPORT_COLUMNS}
+           record["Batch"] = batches.get(record["Maintenance Schedule Name"], "-")
+           record["Resource ID"] = row["_id"]
+           records.append(record)
+           name = record["Maintenance Schedule Name"]
+           if name != "-":
+               schedule = schedules.setdefault(name.lower(), {
+                   "Maintenance Schedule Name": name, "Patching Day": record["Patching Day"],
+                   "Batch": record["Batch"], "VMs": []
+               })
+               schedule["VMs"].append({column: record[column] for column in ("VM Name", "Resource Group", "Subscription Name")})
+   indexes = index_records(records, "VM Name")
+   indexes["schedule"] = schedules
+   return indexes
+INDEXERS = {"tagging": tagging_indexes, "backup": backup_indexes, "patching": patching_indexes}
+class InventoryService:
+   def __init__(self, context, refresh_minutes=None, export_dir=DEFAULT_EXPORT_DIR, backend="graph", max_workers=None):
+       self.context = context
+       self.config = context.config
+       self.tag_columns = self.config.get("tagColumns", DEFAULT_TAG_COLUMNS)
+       self.intervals = {
+           collector: 60 * float((refresh_minutes or {}).get(collector, DEFAULT_REFRESH_MINUTES[collector]))
+           for collector in COLLECTORS
+       }
+       self.export_dir = export_dir
+       self.backend = backend
+       self.max_workers = max_workers or self.config.get("maxWorkers", Back.DEFAULT_MAX_WORKERS)
+       # Refreshes always go through the snapshot store, so only changed
+       # subscriptions are fetched again and a restart starts warm.
+       self.store = open_store(self.config)
+       self.raw_configs = RawConfigCache.from_config(self.config)
+       self.rows = {}
+       self.indexes = {}
+       self.status = {
+           collector: {"refreshed_at": None, "duration_s": None, "rows": 0, "error": None, "refreshing": False}
+           for collector in COLLECTORS
+       }
+       self._lock = threading.Lock()
+       self._export_lock = threading.Lock()
+       self._wake = {collector: threading.Event() for collector in COLLECTORS}
+       self._stop = threading.Event()
+   @classmethod
+   def from_config(cls, config_file="conf.json", **kwargs):
+       context = AzureContext.from_config(config_file)
+       kwargs.setdefault("refresh_minutes", context.config.get("serviceRefreshMinutes"))
+       kwargs.setdefault("export_dir", context.config.get("serviceExportDir", DEFAULT_EXPORT_DIR))
+       return cls(context, **kwargs)
+   def _collect(self, collector, subscriptions):
+       if collector == "tagging":
+           return Tag.collect_tagging(self.context, subscriptions, self.store, self.backend)
+       # Backup and patching share the VM inventory cache; drop entries older than the shorter interval.
+       expire_vm_inventory(min(self.intervals["backup"], self.intervals["patching"]))
+       if collector == "backup":
+           return Back.collect_backup(self.context, subscriptions, self.store, self.max_workers)
+       return patch.collect_patching(self.context, subscriptions, {}, self.raw_configs, self.store)
+   def refresh(self, collector):
+       start = time.perf_counter()
+       with self._lock:
+           self.status[collector]["refreshing"] = True
+       try:
+           with PROFILER.stage(f"service.{collector}"):
+               subscriptions = sorted(self.context.refresh_subscriptions(), key=lambda s: s.subscription_id.lower())
+               rows = [list(sub_rows) for sub_rows in self._collect(collector, subscriptions)]
+               indexes = INDEXERS[collector](rows)
+           if collector == "patching":
+               self.raw_configs.save()
+           with self._lock:
+               self.rows[collector] = rows
+               self.indexes[collector] = indexes
+               self.status[collector].update(
+                   refreshed_at=now(), duration_s=round(time.perf_counter() - start, 2),
+                   rows=sum(len(sub_rows) for sub_rows in rows), error=None
+               )
+           logging.info(f"🔄 {collector} refreshed: {self.status[collector]['rows']} rows")
+       except Exception as e:
+           # The previous data stays available until the next successful refresh.
+           logging.error(f"❌ {collector} refresh failed: {e}")
+           with self._lock:
+               self.status[collector]["error"] = str(e)
+       finally:
+           with self._lock:
+               self.status[collector]["refreshing"] = False
+   def _refresh_loop(self, collector):
+       while not self._stop.is_set():
+           self.refresh(collector)
+           self._wake[collector].wait(self.intervals[collector])
+           self._wake[collector].clear()
+   def start(self):
+       for collector in COLLECTORS:
+           threading.Thread(target=self._refresh_loop, args=(collector,), name=f"refresh-{collector}", daemon=True).start()
+   def request_refresh(self, collector):
+       self._wake[collector].set()
+   def stop(self):
+       self._stop.set()
+       for event in self._wake.values():
+           event.set()
+       # Refresh threads are daemons; an in-flight refresh is abandoned rather than awaited.
+       self.raw_configs.save()
+   def get_status(self):
+       with self._lock:
+           status = {collector: dict(values) for collector, values in self.status.items()}
+       for collector, values in status.items():
+           values["refresh_minutes"] = self.intervals[collector] / 60
+       return status
+   def lookup(self, collector, value, table=None):
+       # None until the collector's first refresh has finished
+       with self._lock:
+           indexes = self.indexes.get(collector)
+       if indexes is None:
+           return None
+       if table:
+           found = indexes[table].get(value.lower())
+           return [found] if found else []
+       if "/" in value:
+           found = indexes["id"].get(normalize_id(value))
+           return [found] if found else []
+       return indexes["name"].get(value.lower(), [])
+   def export(self, report, fmt="xlsx"):
+       # Writes from the rows in memory; returns the written report paths.
+       collectors = COLLECTORS if report == "all" else [report]
+       with self._lock:
+           rows = {collector: self.rows.get(collector) for collector in collectors}
+       missing = [collector for collector, collected in rows.items() if collected is None]
+       if missing:
+           raise LookupError(f"No data collected yet for {', '.join(missing)}")
+       os.makedirs(self.export_dir, exist_ok=True)
+       paths = {collector: os.path.join(self.export_dir, EXPORT_FILES[collector]) for collector in collectors}
+       coverage = CoverageIndex(self.tag_columns) if report == "all" else None
+       with self._export_lock, PROFILER.stage(f"service.export.{report}"):
+           if "tagging" in rows:
+               Tag.export_tagging(rows["tagging"], self.tag_columns, paths["tagging"], fmt, coverage)
+           if "backup" in rows:
+               Back.export_backup(rows["backup"], paths["backup"], fmt, coverage)
+           if "patching" in rows:
+               patch.export_patching(rows["patching"], paths["patching"], fmt, coverage)
+           if coverage is not None:
+               paths["coverage"] = os.path.join(self.export_dir, DEFAULT_COVERAGE_FILE)
+               write_coverage(coverage, paths["coverage"], fmt)
+       return {name: output_path(path, fmt) for name, path in paths.items()}
+# ------------------------ HTTP API ------------------------
+def one_param(params, *names):
+   for name in names:
+       if params.get(name):
+           return name, params[name]
+   raise ValueError(f"expected one of the query parameters: {', '.join(names)}")
+def lookup_response(service, collector, value, table=None):
+   found = service.lookup(collector, value, table)
+   if found is None:
+       return 503, {"error": f"{collector} data is not loaded yet", "status": service.get_status()[collector]}
+   if not found:
+       return 404, {"error": f"no {collector} data for '{value}'"}
+   return 200, found
+def get_status(service, params):
+   return 200, service.get_status()
+def get_metrics(service, params):
+   return 200, PROFILER.to_prometheus()
+def get_backup(service, params):
+   _, value = one_param(params, "vm")
+   return lookup_response(service, "backup", value)
+def get_tags(service, params):
+   _, value = one_param(params, "resource")
+   return lookup_response(service, "tagging", value)
+def get_patching(service, params):
+   name, value = one_param(params, "vm", "schedule")
+   return lookup_response(service, "patching", value, "schedule" if name == "schedule" else None)
+def post_refresh(service, params):
+   collectors = COLLECTORS if params.get("collector", "all") == "all" else [params["collector"]]
+   if not set(collectors) <= set(COLLECTORS):
+       raise ValueError(f"collector must be one of: all, {', '.join(COLLECTORS)}")
+   for collector in collectors:
+       service.request_refresh(collector)
+   return 202, {"refreshing": collectors}
+def post_export(service, params):
+   report = params.get("report", "all")
+   fmt = params.get("format", "xlsx")
+   if report not in ["all", *COLLECTORS] or fmt not in FORMATS:
+       raise ValueError(f"report must be one of: all, {', '.join(COLLECTORS)}; format one of: {', '.join(FORMATS)}")
+   try:
+       return 200, {"files": service.export(report, fmt)}
+   except LookupError as e:
+       return 503, {"error": str(e)}
+ROUTES = {
+   ("GET", "/status"): get_status,
+   ("GET", "/metrics"): get_metrics,
+   ("GET", "/backup"): get_backup,
+   ("GET", "/tags"): get_tags,
+   ("GET", "/patching"): get_patching,
+   ("POST", "/refresh"): post_refresh,
+   ("POST", "/export"): post_export
+}
+class ServiceHandler(BaseHTTPRequestHandler):
+   def do_GET(self):
+       self._dispatch("GET")
+   def do_POST(self):
+       self._dispatch("POST")
+   def _dispatch(self, method):
+       url = urlparse(self.path)
+       params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+       route = ROUTES.get((method, url.path.rstrip("/")))
+       if route is None:
+           self._send(404, {"error": f"unknown endpoint {method} {url.path}"})
+           return
+       try:
+           status, body = route(self.server.service, params)
+       except ValueError as e:
+           status, body = 400, {"error": str(e)}
+       except Exception as e:
+           logging.error(f"❌ {method} {self.path} failed: {e}")
+           status, body = 500, {"error": str(e)}
+       self._send(status, body)
+   def _send(self, status, body):
+       if isinstance(body, str):
+           data, content_type = body.encode("utf-8"), "text/plain; version=0.0.4"
+       else:
+           data, content_type = json.dumps(body, indent=2, default=str).encode("utf-8"), "application/json"
+       self.send_response(status)
+       self.send_header("Content-Type", content_type)
+       self.send_header("Content-Length", str(len(data)))
+       self.end_headers()
+       self.wfile.write(data)
+   def log_message(self, format, *args):
+       logging.info(f"{self.address_string()} - {format % args}")
+def serve(service, host="127.0.0.1", port=DEFAULT_PORT):
+   server = ThreadingHTTPServer((host, port), ServiceHandler)
+   server.service = service
+   service.start()
+   logging.info(f"🚀 Inventory service listening on http://{host}:{server.server_address[1]}")
+   print(f"🚀 Inventory service listening on http://{host}:{server.server_address[1]}")
+   try:
+       server.serve_forever()
+   finally:
+       server.server_close()
+       service.stop()
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Keep the Azure inventory in memory and serve lookups and exports over a local HTTP API")
+   parser.add_argument("--config", default="conf.json")
+   parser.add_argument("--host", default="127.0.0.1", help="address to listen on (the API has no authentication)")
+   parser.add_argument("--port", type=int, help=f"port to listen on (default servicePort or {DEFAULT_PORT})")
+   parser.add_argument("--backend", choices=["graph", "arm"], default="graph", help="tagging backend, as in Tag.py")
+   parser.add_argument("--profile", default="run_profile.json", help="write the run profile (JSON) to this file on shutdown")
+   args = parser.parse_args()
+   try:
+       service = InventoryService.from_config(args.config, backend=args.backend)
+   except Exception as e:
+       logging.critical(f"❌ Could not start from '{args.config}': {e}")
+       sys.exit(1)
+   # Service managers stop with SIGTERM; shut down the same way as Ctrl+C.
+   signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+   try:
+       serve(service, args.host, args.port or service.config.get("servicePort", DEFAULT_PORT))
+   except KeyboardInterrupt:
+       pass
+   finally:
+       PROFILER.write(args.profile)
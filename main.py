@@ -1,21 +1,76 @@
-import subprocess
+import argparse
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-def run_script(script_name):
+timings = {}
+start = time.perf_counter()
+from azure_context import AzureContext, load_config
+from instrumentation import PROFILER
+from Tag import run_tagging
+from Back import run_backup
+from patch import get_azure_update_manager_data
+from vm_coverage import DEFAULT_COVERAGE_FILE, CoverageIndex, write_coverage
+from row_pipeline import FORMATS
+from tag_schema import DEFAULT_TAG_COLUMNS
+from sharding import DEFAULT_PARTIAL_DIR, add_shard_arguments, run_sharded
+timings["import"] = time.perf_counter() - start
+def run_stage(name, func, *args, **kwargs):
+   start = time.perf_counter()
    try:
-       logging.info(f"Running {script_name}...")
-       subprocess.run(["python", script_name], check=True)
-       logging.info(f"{script_name} completed successfully. ✅")
-   except subprocess.CalledProcessError as e:
-       logging.error(f"{script_name} failed with exit code {e.returncode}")
+       logging.info(f"Running {name}...")
+       with PROFILER.stage(name):
+           func(*args, **kwargs)
+       logging.info(f"{name} completed successfully. ✅")
+   except SystemExit as e:
+       logging.error(f"{name} exited with code {e.code}")
    except Exception as e:
-       logging.error(f"Unexpected error running {script_name}: {e}")
+       logging.error(f"Unexpected error running {name}: {e}")
+   finally:
+       timings[name] = time.perf_counter() - start
+def run_all(config_file="conf.json", incremental=False, fmt="xlsx", shard=None, merge=False, partial_dir=DEFAULT_PARTIAL_DIR):
+   start = time.perf_counter()
+   context = None
+   if not merge:
+       # Merging only reads partial results, so it never signs in.
+       context = AzureContext.from_config(config_file)
+       context.authenticate()
+       context.subscriptions
+       timings.update(context.timings)
+   config = context.config if context else load_config(config_file)
+   # Shards only write partial results; the coverage join runs where the reports are written.
+   coverage = None if shard else CoverageIndex(config.get("tagColumns", DEFAULT_TAG_COLUMNS))
+   common = {"config_file": config_file, "context": context, "incremental": incremental, "fmt": fmt,
+             "shard": shard, "merge": merge, "partial_dir": partial_dir, "coverage": coverage}
+   stages = {
+       "Tag.py": (run_tagging, common),
+       "Back.py": (run_backup, common),
+       "patch.py": (get_azure_update_manager_data, common)
+   }
+   with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+       for name, (func, kwargs) in stages.items():
+           executor.submit(run_stage, name, func, **kwargs)
+   if coverage is not None:
+       run_stage("coverage", write_coverage, coverage, DEFAULT_COVERAGE_FILE, fmt)
+   timings["total"] = time.perf_counter() - start + timings["import"]
+def print_timings():
+   print("\n⏱️ Stage timings")
+   for name, seconds in timings.items():
+       print(f"   {name:<15} {seconds:8.2f}s")
 if __name__ == "__main__":
-   scripts = [
-       "Tag.py",
-       "Back.py",
-       "patch.py"
-   ]
-   for script in scripts:
-       run_script(script)
-   logging.info("All scripts executed. Reports are stored locally in the current folder.")
\ No newline at end of file
+   parser = argparse.ArgumentParser(description="Run the tagging, backup and patching collectors")
+   parser.add_argument("--incremental", action="store_true", help="only refetch subscriptions changed since the last snapshot")
+   parser.add_argument("--format", choices=list(FORMATS), default="xlsx",
+                       help="xlsx: formatted workbooks; csv/parquet: typed columns for downstream loads")
+   add_shard_arguments(parser)
+   parser.add_argument("--profile", default="run_profile.json", help="write the run profile (JSON) to this file")
+   parser.add_argument("--prometheus", help="also write the run profile in Prometheus text format to this file")
+   args = parser.parse_args()
+   try:
+       run_sharded(run_all, args, incremental=args.incremental, fmt=args.format)
+   except Exception as e:
+       logging.error(f"Orchestrator failed: {e}")
+   print_timings()
+   PROFILER.write(args.profile, args.prometheus)
+   logging.info(f"Run profile written to {args.profile}")
+   logging.info("All scripts executed. Reports are stored locally in the current folder.")
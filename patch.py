@@ -1,195 +1,330 @@
-import pandas as pd
-import json
-import time
+import argparse
+import re
 import sys
 from datetime import datetime, timedelta
-from azure.identity import ClientSecretCredential
-from azure.mgmt.subscription import SubscriptionClient
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.maintenance import MaintenanceManagementClient
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
-import os
-def get_week_order(patch_day_str):
-   week_map = {"First": 1, "Second": 2, "Third": 3, "Fourth": 4, "Last": 5}
-   for k, v in week_map.items():
-       if patch_day_str.startswith(k):
-           return v
-   return 99
-def get_azure_update_manager_data(config_file: str):
-   try:
-       with open(config_file, 'r') as f:
-           config = json.load(f)
-       credential = ClientSecretCredential(
-           tenant_id=config['tenantId'],
-           client_id=config['clientId'],
-           client_secret=config['clientSecret']
+from azure_context import AzureContext
+from instrumentation import PROFILER
+from sharding import DEFAULT_PARTIAL_DIR, add_shard_arguments, read_partials, run_sharded, write_partial
+from snapshot_store import DEFAULT_MAX_AGE_HOURS, IncompleteRows, collect_with_snapshot, open_store
+from vm_inventory import load_vm_inventory, normalize_id
+from raw_config_cache import RawConfigCache
+from row_pipeline import FORMATS, SpillFile, output_path, sink_for, table_schema, write_table
+PATCH_RESOURCE_TYPES = [
+   "Microsoft.Compute/virtualMachines",
+   "Microsoft.Maintenance/maintenanceConfigurations",
+   "Microsoft.Maintenance/configurationAssignments"
+]
+WEEK_ORDER = {"First": 1, "Second": 2, "Third": 3, "Fourth": 4, "Last": 5}
+WEEK_PATTERN = re.compile(f"^({'|'.join(WEEK_ORDER)})")
+def get_week_order(patch_day):
+   match = WEEK_PATTERN.match(patch_day) if isinstance(patch_day, str) else None
+   return WEEK_ORDER[match.group(1)] if match else 99
+# Version of the row layout kept in snapshots and shard partials
+SNAPSHOT_ROW_FORMAT = 1
+REPORT_COLUMNS = [
+   "Subscription Name", "Resource Group", "VM Location",
+   "VM Name", "Operating System", "OS Version",
+   "Update Manager Status", "Maintenance Schedule Name", "Patching Day",
+   "Maintenance Window Duration", "Patching Downtime", "Time Zone",
+   "Validation Time", "Batch", "Reboot Setting"
+]
+# Typed layout for --format csv/parquet: the window as minutes and real
+# start/end timestamps (in the schedule's Time Zone) instead of formatted text
+PATCH_COLUMNS = [
+   ("Subscription Name", "string"), ("Resource Group", "string"), ("VM Location", "string"),
+   ("VM Name", "string"), ("Operating System", "string"), ("OS Version", "string"),
+   ("Update Manager Status", "string"), ("Maintenance Schedule Name", "string"), ("Patching Day", "string"),
+   ("Maintenance Window Minutes", "int"), ("Schedule Start", "timestamp"), ("Schedule End", "timestamp"),
+   ("Time Zone", "string"), ("Validation Time", "string"), ("Batch", "int"), ("Reboot Setting", "string")
+]
+def schedule_batches(schedules):
+   # schedules holds (name, patching day, start) from the first row of each
+   # schedule, in report order. Schedules are numbered by (week of month,
+   # start datetime), missing starts last; sorted() is stable for ties.
+   ordered = sorted(schedules, key=lambda s: (get_week_order(s[1]), s[2] is None, s[2] or datetime.min))
+   return {name: f"Batch {i+1}" for i, (name, _, _) in enumerate(ordered)}
+def note_schedule(first_seen, row):
+   name = row["Maintenance Schedule Name"]
+   if name != "-" and name not in first_seen:
+       first_seen[name] = (name, row["Patching Day"], row["_start_datetime"])
+def spill_vm_rows(rows_by_subscription, spill):
+   # First pass: rows go to disk as report tuples and only the first row of
+   # each schedule is kept in memory for batch numbering.
+   first_seen = {}
+   for rows in rows_by_subscription:
+       for row in rows:
+           note_schedule(first_seen, row)
+           spill.append((
+               *(row[column] for column in REPORT_COLUMNS),
+               row["_start_datetime"], row["_duration_minutes"], row["_id"]
+           ))
+   return list(first_seen.values())
+def batched_vm_rows(spill, batches):
+   # Second pass: replay the spilled rows with their batch filled in.
+   schedule_index = REPORT_COLUMNS.index("Maintenance Schedule Name")
+   batch_index = REPORT_COLUMNS.index("Batch")
+   for row in spill:
+       row = list(row)
+       row[batch_index] = batches.get(row[schedule_index], "-")
+       yield row
+def coverage_vm_rows(rows, coverage):
+   for row in rows:
+       if not row[-1]:
+           # A subscription whose VMs could not be listed
+           yield row
+           continue
+       values = dict(zip(REPORT_COLUMNS, row))
+       coverage.add_patch(
+           row[-1], values["VM Name"], values["Subscription Name"], values["Resource Group"], values["VM Location"],
+           values["Update Manager Status"], values["Maintenance Schedule Name"], values["Batch"]
        )
+       yield row
+def columnar_vm_row(row):
+   start, minutes = row[len(REPORT_COLUMNS)], row[len(REPORT_COLUMNS) + 1]
+   end = start + timedelta(minutes=minutes) if start and minutes is not None else None
+   return [*row[:9], minutes, start, end, *row[11:len(REPORT_COLUMNS)]]
+def apply_maintenance_config(vm_data, mc_name, mc_dict):
+   vm_data["Maintenance Schedule Name"] = mc_name
+   start_dt = mc_dict.get("start_date_time")
+   duration = mc_dict.get("duration")
+   recur_every = mc_dict.get("recur_every")
+   time_zone = mc_dict.get("time_zone")
+   install_patches = mc_dict.get("install_patches", {})
+   reboot_setting = install_patches.get("reboot_setting", "-")
+   start_time_str = None
+   dt_obj = None
+   if start_dt:
+       try:
+           dt_obj = datetime.strptime(start_dt, "%Y-%m-%d %H:%M")
+           start_time_str = dt_obj.strftime("%I:%M %p")
+           vm_data["_start_datetime"] = dt_obj
+       except Exception:
+           pass
+   if recur_every:
+       parts = recur_every.split()
+       if len(parts) >= 3:
+           vm_data["Patching Day"] = f"{parts[1]} {parts[2]} of the month"
+       else:
+           vm_data["Patching Day"] = recur_every
+   hours_str = "-"
+   duration_hours = None
+   if duration:
+       try:
+           hrs, mins = duration.split(":")
+           hrs, mins = int(hrs), int(mins)
+           duration_hours = hrs + mins / 60
+           vm_data["_duration_minutes"] = hrs * 60 + mins
+           hours_str = (f"{hrs} hours " if hrs else "") + (f"{mins} mins" if mins else "")
+       except Exception:
+           pass
+   vm_data["Maintenance Window Duration"] = hours_str or "-"
+   vm_data["Time Zone"] = time_zone or "-"
+   if start_time_str and duration_hours is not None and dt_obj:
+       try:
+           end_time = dt_obj + timedelta(hours=duration_hours)
+           end_time_str = end_time.strftime("%I:%M %p")
+           vm_data["Patching Downtime"] = f"{start_time_str} - {end_time_str} {time_zone}"
+       except Exception:
+           pass
+   vm_data["Reboot Setting"] = reboot_setting
+def list_subscription_configs(maintenance_client):
+   try:
+       configs = list(maintenance_client.maintenance_configurations.list())
+   except Exception as e:
+       print(f"Could not list maintenance configurations: {e}")
+       return {}
+   return {normalize_id(mc.id): mc for mc in configs}
+def list_subscription_assignments(maintenance_client):
+   try:
+       assignments = list(maintenance_client.configuration_assignments_within_subscription.list())
+   except Exception as e:
+       print(f"Could not list configuration assignments, falling back to per-VM lookups: {e}")
+       return None
+   assignment_map = {}
+   for assignment in assignments:
+       if assignment.resource_id and assignment.maintenance_configuration_id:
+           assignment_map.setdefault(normalize_id(assignment.resource_id), assignment)
+   return assignment_map
+def get_vm_assignment(maintenance_client, vm, assignments):
+   if assignments is not None:
+       return assignments.get(normalize_id(vm["id"]))
+   result = list(maintenance_client.configuration_assignments.list_parent(
+       resource_group_name=vm["resource_group"],
+       provider_name="Microsoft.Compute",
+       resource_parent_type="",
+       resource_parent_name="",
+       resource_type="virtualMachines",
+       resource_name=vm["name"]
+   ))
+   return result[0] if result else None
+def get_maintenance_config(maintenance_client, config_id, config_cache, raw_configs):
+   key = normalize_id(config_id)
+   if key not in config_cache:
+       config = raw_configs.load(config_id) if raw_configs.offline else None
+       if config is None:
+           mc_parts = config_id.split('/')
+           config = maintenance_client.maintenance_configurations.get(mc_parts[4], mc_parts[-1])
+       config_cache[key] = config
+   return raw_configs.config_dict(config_id, config_cache[key])
+def new_vm_row(sub_name, resource_group, location, vm_name, os_type, os_version, resource_id):
+   return {
+       "Subscription Name": sub_name,
+       "Resource Group": resource_group,
+       "VM Location": location,
+       "VM Name": vm_name,
+       "Operating System": os_type,
+       "OS Version": os_version,
+       "Update Manager Status": "Not configured",
+       "Maintenance Schedule Name": "-",
+       "Patching Day": "-",
+       "Maintenance Window Duration": "-",
+       "Patching Downtime": "-",
+       "Time Zone": "-",
+       "Validation Time": "-",
+       "Batch": "-",
+       "Reboot Setting": "-",
+       "_start_datetime": None,
+       "_duration_minutes": None,
+       "_id": resource_id
+   }
+def collect_subscription_vms(context, sub, bulk, config_cache, raw_configs):
+   vm_rows = []
+   sub_name = sub.display_name
+   sub_id = sub.subscription_id
+   from azure.mgmt.compute import ComputeManagementClient
+   from azure.mgmt.maintenance import MaintenanceManagementClient
+   compute_client = context.client(ComputeManagementClient, sub_id)
+   maintenance_client = context.client(MaintenanceManagementClient, sub_id)
+   vms = load_vm_inventory(context.credential, sub_id, compute_client)
+   if vms is None:
+       # Stands in for the subscription's VMs; IncompleteRows keeps it out of the snapshot.
+       print(f"⚠️ Could not list VMs in {sub_name}; its VMs are missing from this report")
+       failed = new_vm_row(sub_name, "-", "-", "-", "-", "-", None)
+       failed["Update Manager Status"] = "Lookup failed"
+       return IncompleteRows([failed], failures=1)
+   raw_configs.prune(sub_id, vms)
+   if not vms:
+       return vm_rows
+   assignments = None
+   failures = 0
+   if bulk:
+       config_cache.update(list_subscription_configs(maintenance_client))
+       assignments = list_subscription_assignments(maintenance_client)
+   for vm in vms.values():
+       vm_name = vm["name"]
+       resource_group_name = vm["resource_group"]
+       vm_data = new_vm_row(sub_name, resource_group_name, vm["location"], vm_name, vm["os_type"], vm["image_offer"],
+                            normalize_id(vm["id"]))
+       try:
+           assignment = get_vm_assignment(maintenance_client, vm, assignments)
+           if assignment:
+               vm_data["Update Manager Status"] = "Configured with schedule"
+               config_id = assignment.maintenance_configuration_id
+               mc_dict = get_maintenance_config(maintenance_client, config_id, config_cache, raw_configs)
+               raw_configs.record(vm["id"], vm_name, config_id)
+               apply_maintenance_config(vm_data, config_id.split('/')[-1], mc_dict)
+           else:
+               raw_configs.forget(vm["id"])
+       except Exception as e:
+           # Transient failures were already retried by the request scheduler; don't report them as "Not configured".
+           vm_data["Update Manager Status"] = "Lookup failed"
+           failures += 1
+           print(f"Could not read maintenance assignment for VM {vm_name}: {e}")
+       vm_rows.append(vm_data)
+   if failures:
+       return IncompleteRows(vm_rows, failures=failures)
+   return vm_rows
+def collect_patching(context, subscriptions, config_cache, raw_configs, store=None, bulk=True):
+   return collect_with_snapshot(
+       store, "patching", "vm_assignment", context, subscriptions,
+       lambda subs: (collect_subscription_vms(context, sub, bulk, config_cache, raw_configs) for sub in subs),
+       record_key=lambda row: f"{row['Resource Group']}/{row['VM Name']}".lower(),
+       resource_types=PATCH_RESOURCE_TYPES,
+       max_age_hours=context.config.get("snapshotMaxAgeHours", DEFAULT_MAX_AGE_HOURS),
+       row_format=SNAPSHOT_ROW_FORMAT
+   )
+def write_patch_report(spill, schedules, file_name, fmt="xlsx", coverage=None):
+   if not spill.count:
+       print("\nNo VM data was collected.")
+       if coverage is not None:
+           coverage.finish("patching")
+       return
+   with PROFILER.stage("patching.assign_batches"):
+       batches = schedule_batches(schedules)
+   file_name = output_path(file_name, fmt)
+   headers, types = table_schema(fmt, REPORT_COLUMNS, PATCH_COLUMNS)
+   rows = batched_vm_rows(spill, batches)
+   if coverage is not None:
+       rows = coverage_vm_rows(rows, coverage)
+   if types:
+       rows = map(columnar_vm_row, rows)
+   else:
+       rows = (row[:len(REPORT_COLUMNS)] for row in rows)
+   with PROFILER.stage("patching.write_report"):
+       sink = sink_for(file_name)
+       write_table(sink, "Sheet1", headers, rows, types)
+       sink.close()
+   if coverage is not None:
+       coverage.finish("patching")
+   print(f"\n✅ Data exported and formatted successfully to {file_name}")
+def export_patching(rows_by_subscription, file_name, fmt="xlsx", coverage=None):
+   # Report from rows collected earlier (shard partials, the inventory service)
+   spill = SpillFile()
+   try:
+       schedules = spill_vm_rows(rows_by_subscription, spill)
+       write_patch_report(spill, schedules, file_name, fmt, coverage)
+   finally:
+       spill.close()
+def get_azure_update_manager_data(config_file: str, bulk=True, context=None, incremental=False, file_name="Patching-Sheet.xlsx", fmt="xlsx",
+                                  offline_configs=False, shard=None, merge=False, partial_dir=DEFAULT_PARTIAL_DIR,
+                                  coverage=None):
+   if merge:
+       # Batches are numbered over the merged estate, exactly as in a single run.
+       with PROFILER.stage("patching.merge"):
+           export_patching(read_partials(partial_dir, "patching", SNAPSHOT_ROW_FORMAT), file_name, fmt, coverage)
+       return
+   try:
+       context = context or AzureContext.from_config(config_file)
    except Exception as e:
        print(f"Authentication failed: {e}")
        sys.exit(1)
-   subscription_client = SubscriptionClient(credential=credential)
    try:
-       subscriptions = list(subscription_client.subscriptions.list())
+       subscriptions = context.subscriptions
    except Exception as e:
        print(f"Failed to list subscriptions: {e}")
        sys.exit(1)
-   all_vm_data = []
-   os.makedirs("debug_raw_configs", exist_ok=True)
-   for sub in subscriptions:
-       sub_name = sub.display_name
-       sub_id = sub.subscription_id
-       compute_client = ComputeManagementClient(credential, sub_id)
-       maintenance_client = MaintenanceManagementClient(credential, sub_id)
-       try:
-           vms = list(compute_client.virtual_machines.list_all())
-           if not vms:
-               continue
-       except Exception:
-           continue
-       for vm in vms:
-           vm_name = vm.name
-           resource_group_name = vm.id.split('/')[4]
-           # OS info
-           os_type = getattr(vm.storage_profile.os_disk, "os_type", "-")
-           os_version = getattr(vm.storage_profile.image_reference, "offer", "-") if getattr(vm.storage_profile, "image_reference", None) else "-"
-           vm_data = {
-               "Subscription Name": sub_name,
-               "Resource Group": resource_group_name,
-               "VM Location": vm.location,
-               "VM Name": vm_name,
-               "Operating System": os_type,
-               "OS Version": os_version,
-               "Update Manager Status": "Not configured",
-               "Maintenance Schedule Name": "-",
-               "Patching Day": "-",
-               "Maintenance Window Duration": "-",
-               "Patching Downtime": "-",
-               "Time Zone": "-",
-               "Validation Time": "-",
-               "Batch": "-",
-               "Reboot Setting": "-",
-               "_start_datetime": None
-           }
-           try:
-               assignments = list(maintenance_client.configuration_assignments.list_parent(
-                   resource_group_name=resource_group_name,
-                   provider_name="Microsoft.Compute",
-                   resource_parent_type="",
-                   resource_parent_name="",
-                   resource_type="virtualMachines",
-                   resource_name=vm_name
-               ))
-               if assignments:
-                   vm_data["Update Manager Status"] = "Configured with schedule"
-                   assignment = assignments[0]
-                   mc_parts = assignment.maintenance_configuration_id.split('/')
-                   mc_resource_group = mc_parts[4]
-                   mc_name = mc_parts[-1]
-                   mc_details = maintenance_client.maintenance_configurations.get(mc_resource_group, mc_name)
-                   vm_data["Maintenance Schedule Name"] = mc_name
-                   mc_dict = mc_details.as_dict()
-                   debug_file = os.path.join("debug_raw_configs", f"{vm_name}_config.json")
-                   with open(debug_file, "w") as df:
-                       json.dump(mc_dict, df, indent=2)
-                   start_dt = mc_dict.get("start_date_time")
-                   duration = mc_dict.get("duration")
-                   recur_every = mc_dict.get("recur_every")
-                   time_zone = mc_dict.get("time_zone")
-                   install_patches = mc_dict.get("install_patches", {})
-                   reboot_setting = install_patches.get("reboot_setting", "-")
-                   start_time_str = None
-                   dt_obj = None
-                   if start_dt:
-                       try:
-                           dt_obj = datetime.strptime(start_dt, "%Y-%m-%d %H:%M")
-                           start_time_str = dt_obj.strftime("%I:%M %p")
-                           vm_data["_start_datetime"] = dt_obj
-                       except Exception:
-                           pass
-                   if recur_every:
-                       parts = recur_every.split()
-                       if len(parts) >= 3:
-                           vm_data["Patching Day"] = f"{parts[1]} {parts[2]} of the month"
-                       else:
-                           vm_data["Patching Day"] = recur_every
-                   hours_str = "-"
-                   duration_hours = None
-                   if duration:
-                       try:
-                           hrs, mins = duration.split(":")
-                           hrs, mins = int(hrs), int(mins)
-                           duration_hours = hrs + mins / 60
-                           hours_str = (f"{hrs} hours " if hrs else "") + (f"{mins} mins" if mins else "")
-                       except Exception:
-                           pass
-                   vm_data["Maintenance Window Duration"] = hours_str or "-"
-                   vm_data["Time Zone"] = time_zone or "-"
-                   if start_time_str and duration_hours is not None and dt_obj:
-                       try:
-                           end_time = dt_obj + timedelta(hours=duration_hours)
-                           end_time_str = end_time.strftime("%I:%M %p")
-                           vm_data["Patching Downtime"] = f"{start_time_str} - {end_time_str} {time_zone}"
-                       except Exception:
-                           pass
-                   vm_data["Reboot Setting"] = reboot_setting
-           except Exception:
-               pass
-           all_vm_data.append(vm_data)
-           time.sleep(0.2)
-   if all_vm_data:
-       df = pd.DataFrame(all_vm_data)
-       # Assign batches
-       schedule_start_map = {}
-       for _, row in df.iterrows():
-           sched = row["Maintenance Schedule Name"]
-           start_dt = row["_start_datetime"]
-           if sched != "-" and sched not in schedule_start_map:
-               schedule_start_map[sched] = start_dt
-       schedule_order_list = sorted(
-           schedule_start_map.keys(),
-           key=lambda x: (get_week_order(df[df["Maintenance Schedule Name"] == x]["Patching Day"].iloc[0]),
-                          schedule_start_map[x])
-       )
-       batch_map = {name: f"Batch {i+1}" for i, name in enumerate(schedule_order_list)}
-       df["Batch"] = df["Maintenance Schedule Name"].map(batch_map).fillna("-")
-       df.drop(columns=["_start_datetime"], inplace=True)
-       # Reorder columns: Subscription Name, Resource Group, VM Location, VM Name, OS, OS Version, ...
-       cols = [
-           "Subscription Name", "Resource Group", "VM Location",
-           "VM Name", "Operating System", "OS Version",
-           "Update Manager Status", "Maintenance Schedule Name", "Patching Day",
-           "Maintenance Window Duration", "Patching Downtime", "Time Zone",
-           "Validation Time", "Batch", "Reboot Setting"
-       ]
-       df = df[cols]
-       file_name = "Patching-Sheet.xlsx"
-       df.to_excel(file_name, index=False)
-       # --- Styling with openpyxl ---
-       wb = load_workbook(file_name)
-       ws = wb.active
-       thin_border = Border(left=Side(style='thin'),
-                            right=Side(style='thin'),
-                            top=Side(style='thin'),
-                            bottom=Side(style='thin'))
-       header_fill = PatternFill(start_color="FF00FF", end_color="FF00FF", fill_type="solid")
-       header_font = Font(color="FFFFFF", bold=True, name="Calibri", size=12)
-       for col in ws.iter_cols(min_row=1, max_row=1, min_col=1, max_col=ws.max_column):
-           for cell in col:
-               cell.fill = header_fill
-               cell.font = header_font
-               cell.border = thin_border
-               cell.alignment = Alignment(horizontal='center', vertical='center')
-       data_font = Font(color="000000", name="Calibri", size=12)
-       data_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-       for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-           for cell in row:
-               cell.font = data_font
-               cell.fill = data_fill
-               cell.border = thin_border
-       wb.save(file_name)
-       print(f"\n✅ Data exported and formatted successfully to {file_name}")
-   else:
-       print("\nNo VM data was collected.")
+   config_cache = {}
+   raw_configs = RawConfigCache.from_config(context.config, offline=offline_configs)
+   store = open_store(context.config) if incremental else None
+   collect = lambda subscriptions: collect_patching(context, subscriptions, config_cache, raw_configs, store, bulk)
+   spill = SpillFile()
+   try:
+       with PROFILER.stage("patching.collect"):
+           if shard:
+               path, row_count = write_partial(partial_dir, "patching", shard, subscriptions, collect, SNAPSHOT_ROW_FORMAT)
+           else:
+               schedules = spill_vm_rows(collect(subscriptions), spill)
+       if store:
+           store.close()
+       raw_configs.save()
+       print(f"Raw configs: {raw_configs.written} written, {raw_configs.reused} unchanged, index in {raw_configs.path}")
+       if shard:
+           print(f"✅ Shard {shard[0]}/{shard[1]}: {row_count} VMs written to {path}")
+       else:
+           write_patch_report(spill, schedules, file_name, fmt, coverage)
+   finally:
+       spill.close()
 if __name__ == "__main__":
-   get_azure_update_manager_data(config_file="conf.json")
\ No newline at end of file
+   parser = argparse.ArgumentParser(description="Export Azure Update Manager patching report")
+   parser.add_argument("--incremental", action="store_true", help="only refetch subscriptions changed since the last snapshot")
+   parser.add_argument("--format", choices=list(FORMATS), default="xlsx",
+                       help="xlsx: formatted workbook; csv/parquet: typed columns for downstream loads")
+   parser.add_argument("--offline-configs", action="store_true",
+                       help="serve maintenance configurations from the raw config cache before calling the API")
+   add_shard_arguments(parser)
+   parser.add_argument("--profile", default="run_profile.json", help="write the run profile (JSON) to this file")
+   parser.add_argument("--prometheus", help="also write the run profile in Prometheus text format to this file")
+   args = parser.parse_args()
+   run_sharded(get_azure_update_manager_data, args, config_file="conf.json", incremental=args.incremental, fmt=args.format,
+               offline_configs=args.offline_configs)
+   PROFILER.write(args.profile, args.prometheus)
\ No newline at end of file
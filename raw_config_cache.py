@@ -0,0 +1,147 @@
+import gzip
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from snapshot_store import content_hash
+from vm_inventory import normalize_id
+# Content-addressed store for raw maintenance configurations: each distinct
+# configuration is written once as <sha256>.json (or .json.gz) and index.json
+# maps configuration IDs and VMs to those files.
+DEFAULT_DIR = "debug_raw_configs"
+INDEX_FILE = "index.json"
+@contextmanager
+def _file_lock(path):
+   # Exclusive lock across processes, e.g. the workers of a --shards run.
+   with open(path, "a+b") as f:
+       if os.name == "nt":
+           import msvcrt
+           f.seek(0)
+           msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+       else:
+           import fcntl
+           fcntl.flock(f, fcntl.LOCK_EX)
+       try:
+           yield
+       finally:
+           if os.name == "nt":
+               f.seek(0)
+               msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+           else:
+               fcntl.flock(f, fcntl.LOCK_UN)
+class RawConfigCache:
+   def __init__(self, path=DEFAULT_DIR, compress=False, offline=False):
+       self.path = path
+       self.compress = compress
+       self.offline = offline
+       self.written = 0
+       self.reused = 0
+       self._dicts = {}
+       self._lock = threading.Lock()
+       os.makedirs(path, exist_ok=True)
+       index = self._read_index()
+       # normalized configuration ID -> hash, normalized VM ID -> assignment
+       self.configs = index.get("configs", {})
+       self.vms = index.get("vms", {})
+       # Keys changed by this process; save() applies only these to the index on disk.
+       self._changed_configs = set()
+       self._changed_vms = set()
+   @classmethod
+   def from_config(cls, config, offline=False):
+       return cls(config.get("rawConfigDir", DEFAULT_DIR), config.get("rawConfigCompress", False), offline)
+   def _read_index(self):
+       try:
+           with open(os.path.join(self.path, INDEX_FILE), encoding="utf-8") as f:
+               return json.load(f)
+       except FileNotFoundError:
+           return {}
+       except Exception as e:
+           logging.warning(f"Ignoring unreadable raw config index: {e}")
+           return {}
+   def _blob_path(self, digest, compress):
+       return os.path.join(self.path, f"{digest}.json.gz" if compress else f"{digest}.json")
+   def _write_blob(self, digest, mc_dict):
+       path = self._blob_path(digest, self.compress)
+       if os.path.exists(path):
+           self.reused += 1
+           return
+       data = json.dumps(mc_dict, indent=2, sort_keys=True, default=str).encode("utf-8")
+       # Shard workers are forked from one thread, so the PID is needed to keep tmp names apart.
+       tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+       with open(tmp_path, "wb") as f:
+           f.write(gzip.compress(data) if self.compress else data)
+       os.replace(tmp_path, path)
+       self.written += 1
+   def config_dict(self, config_id, config):
+       # Returns the configuration as a dict; it is serialized once per run.
+       key = normalize_id(config_id)
+       with self._lock:
+           if key in self._dicts:
+               return self._dicts[key][1]
+       mc_dict = config if isinstance(config, dict) else config.as_dict()
+       digest = content_hash(mc_dict)
+       self._write_blob(digest, mc_dict)
+       with self._lock:
+           self._dicts[key] = (digest, mc_dict)
+           self.configs[key] = digest
+           self._changed_configs.add(key)
+       return mc_dict
+   def load(self, config_id):
+       # Offline lookup: the last stored version of a configuration, or None.
+       digest = self.configs.get(normalize_id(config_id))
+       if digest is None:
+           return None
+       for compress in (self.compress, not self.compress):
+           path = self._blob_path(digest, compress)
+           if os.path.exists(path):
+               with open(path, "rb") as f:
+                   data = f.read()
+               return json.loads(gzip.decompress(data) if compress else data)
+       return None
+   def record(self, vm_id, vm_name, config_id):
+       key = normalize_id(vm_id)
+       with self._lock:
+           self.vms[key] = {
+               "name": vm_name,
+               "config_id": config_id,
+               "hash": self._dicts[normalize_id(config_id)][0]
+           }
+           self._changed_vms.add(key)
+   def forget(self, vm_id):
+       key = normalize_id(vm_id)
+       with self._lock:
+           self.vms.pop(key, None)
+           self._changed_vms.add(key)
+   def prune(self, subscription_id, vm_ids):
+       # Drops the subscription's VMs that are not in vm_ids (normalized IDs
+       # from a successful listing), i.e. VMs that were deleted or moved.
+       prefix = f"/subscriptions/{subscription_id.lower()}/"
+       with self._lock:
+           stale = [key for key in self.vms if key.startswith(prefix) and key not in vm_ids]
+           for key in stale:
+               del self.vms[key]
+           self._changed_vms.update(stale)
+       return len(stale)
+   def save(self):
+       # Shard workers and the service's threads may save concurrently: under
+       # the lock the index is re-read and only this process's changes are applied.
+       path = os.path.join(self.path, INDEX_FILE)
+       with self._lock, _file_lock(f"{path}.lock"):
+           index = self._read_index()
+           configs = index.get("configs", {})
+           vms = index.get("vms", {})
+           for key in self._changed_configs:
+               configs[key] = self.configs[key]
+           for key in self._changed_vms:
+               if key in self.vms:
+                   vms[key] = self.vms[key]
+               else:
+                   vms.pop(key, None)
+           tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+           with open(tmp_path, "w", encoding="utf-8") as f:
+               json.dump({"configs": configs, "vms": vms}, f, indent=1, sort_keys=True)
+           os.replace(tmp_path, path)
+           self.configs, self.vms = configs, vms
+           self._changed_configs.clear()
+           self._changed_vms.clear()
@@ -0,0 +1,57 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Border, Side, Alignment, NamedStyle
+# Streaming workbook writer: rows are styled as they are written in
+# write-only mode and the file is saved once, so no reload/restyle pass.
+HEADER_STYLE = "Report Header"
+DATA_STYLE = "Report Data"
+def _report_styles():
+   thin_border = Border(left=Side(style='thin'),
+                        right=Side(style='thin'),
+                        top=Side(style='thin'),
+                        bottom=Side(style='thin'))
+   header_style = NamedStyle(
+       name=HEADER_STYLE,
+       fill=PatternFill(start_color="FF00FF", end_color="FF00FF", fill_type="solid"),
+       font=Font(color="FFFFFF", bold=True, name="Calibri", size=12),
+       border=thin_border,
+       alignment=Alignment(horizontal='center', vertical='center')
+   )
+   data_style = NamedStyle(
+       name=DATA_STYLE,
+       fill=PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid"),
+       font=Font(color="000000", name="Calibri", size=12),
+       border=thin_border
+   )
+   return header_style, data_style
+def _styled_row(ws, values, style):
+   row = []
+   for value in values:
+       if isinstance(value, float) and value != value:
+           value = None
+       cell = WriteOnlyCell(ws, value=value)
+       cell.style = style
+       row.append(cell)
+   return row
+class ExcelSink:
+   # Sink for row_pipeline.write_table; see row_pipeline.sink_for
+   def __init__(self, path):
+       self.path = path
+       self.wb = Workbook(write_only=True)
+       for style in _report_styles():
+           self.wb.add_named_style(style)
+       self.ws = None
+   def open_table(self, title, headers, types=None):
+       self.ws = self.wb.create_sheet(title=title)
+       self.ws.append(_styled_row(self.ws, headers, HEADER_STYLE))
+   def write(self, row):
+       self.ws.append(_styled_row(self.ws, row, DATA_STYLE))
+   def close_table(self, completed=True):
+       if not completed:
+           # Nothing has been written to self.path yet; drop the workbook and its temp files.
+           self.ws.close()
+           self.wb = None
+       self.ws = None
+   def close(self):
+       if self.wb is not None:
+           self.wb.save(self.path)
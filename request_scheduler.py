@@ -0,0 +1,165 @@
+import logging
+import random
+import threading
+import time
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from azure.core.pipeline.policies import RetryPolicy
+from instrumentation import PROFILER, subscription_from_url
+# Shared ARM request scheduler: a token bucket per subscription kept in sync
+# with the x-ms-ratelimit-remaining-* headers, plus jittered exponential
+# backoff (honouring Retry-After) for transient failures only.
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+DEFAULT_BUCKET_SIZE = 250
+DEFAULT_REFILL_PER_SECOND = 25.0
+DEFAULT_MAX_RETRIES = 8
+DEFAULT_BACKOFF_BASE = 0.8
+DEFAULT_BACKOFF_MAX = 60.0
+# Requests outside a subscription get their own buckets: tenant-level ARM reads
+# (subscription listing) are throttled per tenant, and Resource Graph queries,
+# which name up to 1000 subscriptions in the body, against a per-user quota of
+# about 15 requests per 5 seconds reported in x-ms-user-quota-*.
+TENANT_BUCKET = "tenant"
+RESOURCE_GRAPH_BUCKET = "resourcegraph"
+DEFAULT_GRAPH_BUCKET_SIZE = 15
+DEFAULT_GRAPH_REFILL_PER_SECOND = 3.0
+def bucket_key(url):
+   subscription = subscription_from_url(url)
+   if subscription != "-":
+       return subscription
+   if "/providers/microsoft.resourcegraph/" in url.lower():
+       return RESOURCE_GRAPH_BUCKET
+   return TENANT_BUCKET
+class TokenBucket:
+   def __init__(self, capacity, refill_per_second):
+       self.capacity = capacity
+       self.refill_per_second = refill_per_second
+       self.tokens = float(capacity)
+       self.updated = time.monotonic()
+       self.blocked_until = 0.0
+       self._lock = threading.Lock()
+   def _refill(self, now):
+       self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+       self.updated = now
+   def acquire(self):
+       waited = 0.0
+       while True:
+           with self._lock:
+               now = time.monotonic()
+               self._refill(now)
+               if now >= self.blocked_until and self.tokens >= 1:
+                   self.tokens -= 1
+                   return waited
+               wait = max(self.blocked_until - now, (1 - self.tokens) / self.refill_per_second)
+           time.sleep(wait)
+           waited += wait
+   def sync_remaining(self, remaining):
+       with self._lock:
+           self._refill(time.monotonic())
+           self.tokens = min(self.tokens, float(remaining))
+   def block_for(self, seconds):
+       # Everyone sharing this subscription waits out a 429, not just the caller.
+       with self._lock:
+           self.tokens = 0.0
+           self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+class RequestScheduler:
+   def __init__(self, bucket_size=DEFAULT_BUCKET_SIZE, refill_per_second=DEFAULT_REFILL_PER_SECOND,
+                max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX,
+                graph_bucket_size=DEFAULT_GRAPH_BUCKET_SIZE, graph_refill_per_second=DEFAULT_GRAPH_REFILL_PER_SECOND):
+       self.bucket_size = bucket_size
+       self.refill_per_second = refill_per_second
+       self.graph_bucket_size = graph_bucket_size
+       self.graph_refill_per_second = graph_refill_per_second
+       self.max_retries = max_retries
+       self.backoff_base = backoff_base
+       self.backoff_max = backoff_max
+       self._buckets = {}
+       self._lock = threading.Lock()
+   @classmethod
+   def from_config(cls, config):
+       return cls(
+           bucket_size=config.get("armBucketSize", DEFAULT_BUCKET_SIZE),
+           refill_per_second=config.get("armRefillPerSecond", DEFAULT_REFILL_PER_SECOND),
+           max_retries=config.get("maxRetries", DEFAULT_MAX_RETRIES),
+           graph_bucket_size=config.get("graphBucketSize", DEFAULT_GRAPH_BUCKET_SIZE),
+           graph_refill_per_second=config.get("graphRefillPerSecond", DEFAULT_GRAPH_REFILL_PER_SECOND)
+       )
+   def bucket(self, key):
+       # key is a subscription ID, TENANT_BUCKET or RESOURCE_GRAPH_BUCKET (see bucket_key)
+       with self._lock:
+           if key not in self._buckets:
+               if key == RESOURCE_GRAPH_BUCKET:
+                   self._buckets[key] = TokenBucket(self.graph_bucket_size, self.graph_refill_per_second)
+               else:
+                   self._buckets[key] = TokenBucket(self.bucket_size, self.refill_per_second)
+           return self._buckets[key]
+   def acquire(self, key):
+       waited = self.bucket(key).acquire()
+       if waited:
+           PROFILER.increment("scheduler_wait_ms", int(waited * 1000))
+   def observe(self, key, headers):
+       remaining = []
+       for name, value in headers.items():
+           lowered = name.lower()
+           if lowered.startswith("x-ms-ratelimit-remaining-subscription") or lowered == "x-ms-user-quota-remaining":
+               try:
+                   remaining.append(int(value))
+               except ValueError:
+                   continue
+       if remaining:
+           self.bucket(key).sync_remaining(min(remaining))
+       # Resource Graph reports its own quota window as hh:mm:ss
+       resets_after = headers.get("x-ms-user-quota-resets-after")
+       if resets_after and remaining and min(remaining) <= 0:
+           try:
+               h, m, s = (float(p) for p in resets_after.split(":"))
+           except ValueError:
+               return
+           self.bucket(key).block_for(h * 3600 + m * 60 + s)
+   def backoff(self, attempt, retry_after=None):
+       if retry_after is not None:
+           return retry_after + random.uniform(0, 1)
+       # Full jitter keeps concurrent workers from retrying in lockstep.
+       return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+def _retry_after(headers):
+   value = headers.get("Retry-After") or headers.get("retry-after")
+   try:
+       return float(value) if value is not None else None
+   except ValueError:
+       return None
+class SchedulerRetryPolicy(RetryPolicy):
+   # Replaces the SDK's default retry policy so every client in the process
+   # shares one budget per subscription and one backoff strategy.
+   def __init__(self, scheduler, **kwargs):
+       super().__init__(**kwargs)
+       self.scheduler = scheduler
+   def send(self, request):
+       http_request = request.http_request
+       key = bucket_key(http_request.url)
+       attempt = 0
+       while True:
+           self.scheduler.acquire(key)
+           try:
+               response = self.next.send(request)
+           except (ServiceRequestError, ServiceResponseError) as e:
+               if attempt >= self.scheduler.max_retries:
+                   raise
+               delay = self.scheduler.backoff(attempt)
+               logging.warning(f"Connection error on {http_request.method} {http_request.url}: {e}; retrying in {delay:.1f}s")
+           else:
+               headers = response.http_response.headers
+               self.scheduler.observe(key, headers)
+               status = response.http_response.status_code
+               if status not in TRANSIENT_STATUS or attempt >= self.scheduler.max_retries:
+                   return response
+               retry_after = _retry_after(headers)
+               delay = self.scheduler.backoff(attempt, retry_after)
+               logging.warning(f"HTTP {status} on {http_request.method} {http_request.url}; retrying in {delay:.1f}s "
+                               f"(attempt {attempt + 1}/{self.scheduler.max_retries})")
+               if status == 429:
+                   # acquire() on the next attempt waits until the block lifts
+                   self.scheduler.bucket(key).block_for(delay)
+                   delay = 0.0
+           PROFILER.increment("scheduler_retries")
+           attempt += 1
+           if delay:
+               time.sleep(delay)
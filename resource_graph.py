@@ -0,0 +1,43 @@
+import logging
+# Azure Resource Graph helpers. Queries are sent for up to 1000 subscriptions
+# at a time and paged with skip tokens.
+SUBSCRIPTION_BATCH_SIZE = 1000
+PAGE_SIZE = 1000
+def batched(items, size):
+   for i in range(0, len(items), size):
+       yield items[i:i + size]
+def query_resource_graph(context, query, subscription_ids, page_size=PAGE_SIZE, batch_size=SUBSCRIPTION_BATCH_SIZE):
+   from azure.mgmt.resourcegraph import ResourceGraphClient
+   from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+   client = context.client(ResourceGraphClient)
+   for batch in batched(list(subscription_ids), batch_size):
+       skip_token = None
+       while True:
+           request = QueryRequest(
+               query=query,
+               subscriptions=batch,
+               options=QueryRequestOptions(top=page_size, skip_token=skip_token, result_format="objectArray")
+           )
+           response = client.resources(request)
+           for row in response.data or []:
+               yield row
+           skip_token = response.skip_token
+           if not skip_token:
+               break
+def changed_subscription_ids(context, subscription_ids, since, resource_types=None):
+   # resourcechanges keeps roughly 14 days of history; callers fall back to a
+   # full refresh for anything older than that.
+   type_filter = ""
+   if resource_types:
+       types = ", ".join(f"'{t.lower()}'" for t in resource_types)
+       type_filter = f"| where tolower(tostring(properties.targetResourceType)) in ({types}) "
+   query = (
+       "resourcechanges "
+       f"| extend changeTime = todatetime(properties.changeAttributes.timestamp) "
+       f"| where changeTime > datetime({since.strftime('%Y-%m-%dT%H:%M:%SZ')}) "
+       f"{type_filter}"
+       "| summarize by subscriptionId"
+   )
+   changed = {row["subscriptionId"].lower() for row in query_resource_graph(context, query, subscription_ids)}
+   logging.info(f"Resource Graph reports changes in {len(changed)} of {len(subscription_ids)} subscriptions since {since.isoformat()}")
+   return changed
@@ -0,0 +1,199 @@
+import csv
+import itertools
+import re
+import os
+import pickle
+import tempfile
+from collections import deque
+# Streaming row pipeline: collectors yield report rows one at a time and the
+# sink writes them as they arrive, so no stage holds the whole estate.
+# A report is a sequence of tables (Excel sheets); single-table formats put
+# extra tables next to the main file.
+PARQUET_CHUNK_ROWS = 10000
+# --format choices; xlsx keeps the formatted report, the columnar formats
+# write typed values (see typed_value) for downstream loads.
+FORMATS = {"xlsx": ".xlsx", "csv": ".csv", "parquet": ".parquet"}
+COLUMN_TYPES = ("string", "int", "float", "bool", "timestamp")
+LEADING_NUMBER = re.compile(r"^\s*(-?\d+(?:\.\d+)?)")
+def _clean(value):
+   if isinstance(value, float) and value != value:
+       return None
+   return value
+def typed_value(value, kind):
+   # "-" is the report's placeholder for "no value"; columnar outputs use null.
+   value = _clean(value)
+   if value is None or value == "-":
+       return None
+   if kind == "string":
+       return str(value)
+   if kind in ("int", "float"):
+       if isinstance(value, str):
+           # Formatted counts such as "30 Days" or "Batch 3"
+           match = LEADING_NUMBER.match(value) or re.search(r"(-?\d+(?:\.\d+)?)\s*$", value)
+           if not match:
+               return None
+           value = match.group(1)
+       return int(float(value)) if kind == "int" else float(value)
+   if kind == "bool":
+       if isinstance(value, str):
+           return value.strip().lower() in ("yes", "true", "1")
+       return bool(value)
+   return value
+def output_path(path, fmt):
+   return os.path.splitext(path)[0] + FORMATS[fmt]
+def table_schema(fmt, headers, columns):
+   # columns: (name, type) pairs giving the typed layout of the same rows
+   if fmt == "xlsx":
+       return list(headers), None
+   return [name for name, _ in columns], [kind for _, kind in columns]
+def _table_path(path, title, first):
+   if first:
+       return path
+   stem, ext = os.path.splitext(path)
+   return f"{stem}_{title.lower().replace(' ', '_')}{ext}"
+def _tmp_path(path):
+   # Tables are written next to their final path and only moved into place
+   # once complete, so a failed run never leaves a truncated report behind.
+   return f"{path}.{os.getpid()}.tmp"
+def _finish_file(path, completed):
+   if completed:
+       os.replace(_tmp_path(path), path)
+   else:
+       os.remove(_tmp_path(path))
+def _excel_sink(path):
+   # openpyxl is only loaded when an xlsx report is written
+   from report_writer import ExcelSink
+   return ExcelSink(path)
+class CsvSink:
+   def __init__(self, path):
+       self.path = path
+       self.paths = []
+       self._file = None
+       self._writer = None
+   def open_table(self, title, headers, types=None):
+       path = _table_path(self.path, title, not self.paths)
+       self.paths.append(path)
+       # utf-8-sig so Excel opens the file with the right encoding
+       self._file = open(_tmp_path(path), "w", newline="", encoding="utf-8-sig")
+       self._writer = csv.writer(self._file)
+       self._writer.writerow(headers)
+   def write(self, row):
+       self._writer.writerow([value.isoformat() if hasattr(value, "isoformat") else _clean(value) for value in row])
+   def close_table(self, completed=True):
+       self._file.close()
+       self._file = self._writer = None
+       _finish_file(self.paths[-1], completed)
+   def close(self):
+       pass
+class ParquetSink:
+   def __init__(self, path, chunk_rows=PARQUET_CHUNK_ROWS):
+       self.path = path
+       self.paths = []
+       self.chunk_rows = chunk_rows
+       self._writer = None
+       self._buffer = []
+   def open_table(self, title, headers, types=None):
+       # pyarrow is only needed for this format, so it is imported here.
+       import pyarrow as pa
+       import pyarrow.parquet as pq
+       arrow_types = {
+           "string": pa.string(), "int": pa.int64(), "float": pa.float64(),
+           "bool": pa.bool_(), "timestamp": pa.timestamp("us")
+       }
+       path = _table_path(self.path, title, not self.paths)
+       self.paths.append(path)
+       self.types = list(types or ["string"] * len(headers))
+       self.schema = pa.schema([(header, arrow_types[kind]) for header, kind in zip(headers, self.types)])
+       self._writer = pq.ParquetWriter(_tmp_path(path), self.schema)
+   def _flush(self):
+       import pyarrow as pa
+       if self._buffer:
+           columns = [
+               pa.array(
+                   [None if value is None else str(value) for value in column] if kind == "string" else list(column),
+                   type=field.type
+               )
+               for column, kind, field in zip(zip(*self._buffer), self.types, self.schema)
+           ]
+           self._writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=self.schema))
+           self._buffer = []
+   def write(self, row):
+       self._buffer.append([_clean(value) for value in row])
+       if len(self._buffer) >= self.chunk_rows:
+           self._flush()
+   def close_table(self, completed=True):
+       if completed:
+           self._flush()
+       self._buffer = []
+       self._writer.close()
+       self._writer = None
+       _finish_file(self.paths[-1], completed)
+   def close(self):
+       pass
+SINKS = {
+   ".xlsx": _excel_sink,
+   ".csv": CsvSink,
+   ".parquet": ParquetSink
+}
+def sink_for(path):
+   ext = os.path.splitext(path)[1].lower()
+   if ext not in SINKS:
+       raise ValueError(f"Unsupported output file '{path}' (expected one of {', '.join(SINKS)})")
+   return SINKS[ext](path)
+def write_table(sink, title, headers, rows, types=None):
+   # With types, values are converted by typed_value before reaching the sink.
+   # If rows raise, the table is closed as incomplete and nothing is published.
+   unknown = sorted(set(types or ()) - set(COLUMN_TYPES))
+   if unknown:
+       raise ValueError(f"Unknown column types {unknown} for table '{title}' (expected one of {', '.join(COLUMN_TYPES)})")
+   sink.open_table(title, headers, types)
+   count = 0
+   completed = False
+   try:
+       for row in rows:
+           if types:
+               row = [typed_value(value, kind) for value, kind in zip(row, types)]
+           sink.write(row)
+           count += 1
+       completed = True
+   finally:
+       sink.close_table(completed)
+   return count
+def peek_rows(rows):
+   # Returns None for an empty stream, otherwise an iterator over all rows.
+   rows = iter(rows)
+   first = next(rows, None)
+   if first is None:
+       return None
+   return itertools.chain([first], rows)
+def chunked(rows, size):
+   rows = iter(rows)
+   while True:
+       chunk = list(itertools.islice(rows, size))
+       if not chunk:
+           return
+       yield chunk
+def ordered_map(executor, func, items, window):
+   # Like executor.map, but keeps at most `window` results in flight so a slow
+   # consumer doesn't let finished results pile up in memory.
+   pending = deque()
+   for item in items:
+       pending.append(executor.submit(func, item))
+       if len(pending) >= window:
+           yield pending.popleft().result()
+   while pending:
+       yield pending.popleft().result()
+class SpillFile:
+   # Append-only row spill on local disk for steps that need a second pass.
+   def __init__(self):
+       self._file = tempfile.TemporaryFile()
+       self.count = 0
+   def append(self, row):
+       pickle.dump(row, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+       self.count += 1
+   def __iter__(self):
+       self._file.seek(0)
+       for _ in range(self.count):
+           yield pickle.load(self._file)
+   def close(self):
+       self._file.close()
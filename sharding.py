@@ -0,0 +1,106 @@
+import argparse
+import glob
+import hashlib
+import heapq
+import logging
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
+# Sharded runs: subscriptions are split into N shards by a stable hash of
+# their ID. Each shard collects its rows into a partial file (on this host or
+# another node), and a merge step replays all partials in the original
+# subscription order through the normal report path.
+DEFAULT_PARTIAL_DIR = "partials"
+PARTIAL_NAME = re.compile(r"^(?P<collector>\w+)-(?P<index>\d+)-of-(?P<count>\d+)\.partial$")
+def parse_shard(text):
+   match = re.fullmatch(r"(\d+)/(\d+)", text.strip())
+   if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+       raise argparse.ArgumentTypeError(f"expected i/N with 0 <= i < N, got '{text}'")
+   return int(match.group(1)), int(match.group(2))
+def shard_of(subscription_id, count):
+   digest = hashlib.sha256(subscription_id.lower().encode("utf-8")).digest()
+   return int.from_bytes(digest[:8], "big") % count
+def partial_path(partial_dir, collector, shard):
+   return os.path.join(partial_dir, f"{collector}-{shard[0]}-of-{shard[1]}.partial")
+def write_partial(partial_dir, collector, shard, subscriptions, collect, row_format=None):
+   # collect(subscriptions) yields one list of rows per subscription, in order.
+   # Rows are stored with the subscription's position in the full list, sorted
+   # by ID so that every node agrees on it whatever order the API returned.
+   subscriptions = sorted(subscriptions, key=lambda s: s.subscription_id.lower())
+   selected = [(position, sub) for position, sub in enumerate(subscriptions) if shard_of(sub.subscription_id, shard[1]) == shard[0]]
+   logging.info(f"[{collector}] Shard {shard[0]}/{shard[1]}: {len(selected)} of {len(subscriptions)} subscriptions")
+   os.makedirs(partial_dir, exist_ok=True)
+   path = partial_path(partial_dir, collector, shard)
+   rows_written = 0
+   with open(f"{path}.tmp", "wb") as f:
+       pickle.dump({"collector": collector, "shard": shard, "subscriptions": len(subscriptions), "row_format": row_format}, f)
+       for (position, _), rows in zip(selected, collect([sub for _, sub in selected])):
+           pickle.dump((position, rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+           rows_written += len(rows)
+   os.replace(f"{path}.tmp", path)
+   return path, rows_written
+def _partial_header(path):
+   with open(path, "rb") as f:
+       return pickle.load(f)
+def _partial_records(path):
+   with open(path, "rb") as f:
+       pickle.load(f)
+       while True:
+           try:
+               yield pickle.load(f)
+           except EOFError:
+               return
+def partial_files(partial_dir, collector):
+   # Uses the most recently written shard count if older runs left other sets behind.
+   sets = {}
+   for path in glob.glob(os.path.join(partial_dir, f"{collector}-*-of-*.partial")):
+       match = PARTIAL_NAME.match(os.path.basename(path))
+       if match and match.group("collector") == collector:
+           sets.setdefault(int(match.group("count")), {})[int(match.group("index"))] = path
+   if not sets:
+       raise ValueError(f"No {collector} partial results in {partial_dir}")
+   count = max(sets, key=lambda c: max(os.path.getmtime(p) for p in sets[c].values()))
+   if len(sets) > 1:
+       logging.warning(f"[{collector}] Ignoring partials from other shard counts than {count} in {partial_dir}")
+   missing = [i for i in range(count) if i not in sets[count]]
+   if missing:
+       raise ValueError(f"Missing {collector} shards {missing} of {count} in {partial_dir}")
+   return [sets[count][i] for i in range(count)]
+def read_partials(partial_dir, collector, row_format=None):
+   # Streams every shard's rows back in global subscription order; the headers
+   # are checked up front so a stale shard fails before the report is opened.
+   paths = partial_files(partial_dir, collector)
+   headers = [_partial_header(path) for path in paths]
+   stale = [path for path, header in zip(paths, headers) if header.get("row_format") != row_format]
+   if stale:
+       raise ValueError(f"{collector} partials {stale} were written with another row format; rerun those shards")
+   totals = {header["subscriptions"] for header in headers}
+   if len(totals) > 1:
+       logging.warning(f"[{collector}] Shards saw different subscription counts {sorted(totals)}; the merged report may be incomplete")
+   return _merged_rows(paths)
+def _merged_rows(paths):
+   merged = heapq.merge(*(_partial_records(path) for path in paths), key=lambda record: record[0])
+   for _, rows in merged:
+       yield rows
+def add_shard_arguments(parser):
+   group = parser.add_mutually_exclusive_group()
+   group.add_argument("--shard", type=parse_shard, metavar="i/N",
+                      help="collect only shard i of N (0-based) and write a partial result to --partial-dir")
+   group.add_argument("--merge", action="store_true", help="build the reports from the partial results in --partial-dir")
+   group.add_argument("--shards", type=int, metavar="N", help="run N shards in a local process pool, then merge")
+   parser.add_argument("--partial-dir", default=DEFAULT_PARTIAL_DIR, help="where shard partial results are written and read")
+def run_local_shards(func, count, **kwargs):
+   # Each process authenticates and lists subscriptions on its own.
+   with ProcessPoolExecutor(max_workers=count) as executor:
+       futures = [executor.submit(func, shard=(i, count), **kwargs) for i in range(count)]
+       for future in futures:
+           future.result()
+def run_sharded(func, args, **kwargs):
+   kwargs["partial_dir"] = args.partial_dir
+   if args.shards:
+       run_local_shards(func, args.shards, **kwargs)
+       return func(merge=True, **kwargs)
+   if args.shard:
+       return func(shard=args.shard, **kwargs)
+   return func(merge=args.merge, **kwargs)
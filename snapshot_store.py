@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from resource_graph import changed_subscription_ids
+# Local SQLite snapshot of collected rows, used for incremental runs: only
+# subscriptions with changes since their last sync are fetched again.
+DEFAULT_STORE = "snapshot.db"
+DEFAULT_MAX_AGE_HOURS = 168
+CHANGE_HISTORY = timedelta(days=14)
+def content_hash(payload):
+   return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+# Rows are stored as JSON; tuples come back as lists and datetimes are tagged.
+def _encode(value):
+   if isinstance(value, datetime):
+       return {"__datetime__": value.isoformat()}
+   raise TypeError(f"Cannot store {type(value).__name__} in the snapshot")
+def _decode(obj):
+   if len(obj) == 1 and "__datetime__" in obj:
+       return datetime.fromisoformat(obj["__datetime__"])
+   return obj
+def dump_payload(payload):
+   return json.dumps(payload, default=_encode)
+def load_payload(data):
+   return json.loads(data, object_hook=_decode)
+class IncompleteRows(list):
+   # One subscription's rows when part of its collection failed. They are
+   # reported, but never saved, so the next incremental run fetches it again.
+   def __init__(self, rows=(), failures=0):
+       super().__init__(rows)
+       self.failures = failures
+class SnapshotStore:
+   def __init__(self, path=DEFAULT_STORE):
+       self.path = path
+       self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+       self._lock = threading.Lock()
+       with self._conn:
+           self._conn.execute(
+               "CREATE TABLE IF NOT EXISTS records ("
+               "collector TEXT, subscription_id TEXT, kind TEXT, record_key TEXT, position INTEGER, "
+               "content_hash TEXT, payload BLOB, "
+               "PRIMARY KEY (collector, subscription_id, record_key))"
+           )
+           self._conn.execute(
+               "CREATE TABLE IF NOT EXISTS syncs ("
+               "collector TEXT, subscription_id TEXT, synced_at TEXT, row_format INTEGER, "
+               "PRIMARY KEY (collector, subscription_id))"
+           )
+           # Stores from before row formats were recorded: their rows never match and are refetched.
+           columns = [row[1] for row in self._conn.execute("PRAGMA table_info(syncs)")]
+           if "row_format" not in columns:
+               self._conn.execute("ALTER TABLE syncs ADD COLUMN row_format INTEGER")
+   def last_sync(self, collector, subscription_id, row_format=None):
+       # None (never synced) if the stored rows were written in another row format.
+       with self._lock:
+           row = self._conn.execute(
+               "SELECT synced_at, row_format FROM syncs WHERE collector = ? AND subscription_id = ?",
+               (collector, subscription_id.lower())
+           ).fetchone()
+       if not row or row[1] != row_format:
+           return None
+       return datetime.fromisoformat(row[0])
+   def load_records(self, collector, subscription_id):
+       with self._lock:
+           rows = self._conn.execute(
+               "SELECT payload FROM records WHERE collector = ? AND subscription_id = ? ORDER BY position",
+               (collector, subscription_id.lower())
+           ).fetchall()
+       return [load_payload(row[0]) for row in rows]
+   def save_records(self, collector, subscription_id, kind, records, synced_at, row_format=None):
+       # records: iterable of (key, payload) in report order
+       subscription_id = subscription_id.lower()
+       stats = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0}
+       with self._lock, self._conn:
+           previous = dict(self._conn.execute(
+               "SELECT record_key, content_hash FROM records WHERE collector = ? AND subscription_id = ?",
+               (collector, subscription_id)
+           ).fetchall())
+           rows = []
+           for position, (key, payload) in enumerate(records):
+               digest = content_hash(payload)
+               old = previous.pop(key, None)
+               if old is None:
+                   stats["added"] += 1
+               elif old != digest:
+                   stats["changed"] += 1
+               else:
+                   stats["unchanged"] += 1
+               rows.append((collector, subscription_id, kind, key, position, digest, dump_payload(payload)))
+           stats["removed"] = len(previous)
+           self._conn.execute("DELETE FROM records WHERE collector = ? AND subscription_id = ?", (collector, subscription_id))
+           self._conn.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+           self._conn.execute(
+               "INSERT OR REPLACE INTO syncs VALUES (?, ?, ?, ?)",
+               (collector, subscription_id, synced_at.isoformat(), row_format)
+           )
+       return stats
+   def forget_sync(self, collector, subscription_id):
+       with self._lock, self._conn:
+           self._conn.execute(
+               "DELETE FROM syncs WHERE collector = ? AND subscription_id = ?",
+               (collector, subscription_id.lower())
+           )
+   def close(self):
+       self._conn.close()
+def open_store(config):
+   return SnapshotStore(config.get("snapshotStore", DEFAULT_STORE))
+def plan_refresh(store, collector, context, subscriptions, resource_types=None, max_age_hours=DEFAULT_MAX_AGE_HOURS,
+                 row_format=None):
+   now = datetime.now(timezone.utc)
+   max_age = min(timedelta(hours=max_age_hours), CHANGE_HISTORY)
+   stale = set()
+   candidates = {}
+   for sub in subscriptions:
+       last = store.last_sync(collector, sub.subscription_id, row_format)
+       if last is None or now - last > max_age:
+           stale.add(sub.subscription_id.lower())
+       else:
+           candidates[sub.subscription_id.lower()] = last
+   if candidates:
+       try:
+           stale |= changed_subscription_ids(context, list(candidates), min(candidates.values()), resource_types)
+       except Exception as e:
+           logging.warning(f"Could not query resource changes, refreshing all subscriptions: {e}")
+           stale |= set(candidates)
+   return stale
+def collect_with_snapshot(store, collector, kind, context, subscriptions, collect, record_key,
+                          resource_types=None, max_age_hours=DEFAULT_MAX_AGE_HOURS, row_format=None, stale=None):
+   # collect(subscriptions) yields one list of rows per subscription, in order;
+   # so does this generator, so only one subscription's rows are held at a time.
+   # row_format is the collector's row layout version; bump it when the shape
+   # of a row changes so older snapshots are refetched instead of replayed.
+   # stale, if given, is the set of subscription IDs (lower case) to fetch
+   # instead of planning it from resourcechanges.
+   if store is None:
+       yield from collect(subscriptions)
+       return
+   run_started = datetime.now(timezone.utc)
+   if stale is None:
+       stale = plan_refresh(store, collector, context, subscriptions, resource_types, max_age_hours, row_format)
+   to_fetch = [sub for sub in subscriptions if sub.subscription_id.lower() in stale]
+   logging.info(f"[{collector}] Refreshing {len(to_fetch)} of {len(subscriptions)} subscriptions from Azure")
+   fetched = iter(collect(to_fetch))
+   totals = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0}
+   for sub in subscriptions:
+       if sub.subscription_id.lower() in stale:
+           rows = next(fetched)
+           if isinstance(rows, IncompleteRows):
+               store.forget_sync(collector, sub.subscription_id)
+               logging.warning(f"[{collector}] {sub.display_name}: {rows.failures} lookups failed; "
+                               f"not saved to the snapshot, it is fetched again on the next run")
+           else:
+               stats = store.save_records(
+                   collector, sub.subscription_id, kind,
+                   ((record_key(row), row) for row in rows),
+                   run_started, row_format
+               )
+               for name, count in stats.items():
+                   totals[name] += count
+       else:
+           rows = store.load_records(collector, sub.subscription_id)
+       yield rows
+   logging.info(f"[{collector}] Snapshot diff: {totals}")
@@ -0,0 +1,62 @@
+# Columnar tag extraction: raw tag maps are exploded once into a long
+# (resource, key, value) frame and every report column is derived from it
+# with vectorized pandas operations.
+DEFAULT_TAG_COLUMNS = ["Environment", "Application", "Owner", "Owner Email", "Comments"]
+RESOURCE_COLUMNS = ["_id", "Name", "Resource Type", "Resource Group", "Location", "Subscription", "_tags"]
+def resource_frame(rows):
+   # pandas is imported on first use so importing Tag stays cheap
+   import pandas as pd
+   return pd.DataFrame.from_records(rows, columns=RESOURCE_COLUMNS)
+def long_tags(frame):
+   import pandas as pd
+   pairs = frame["_tags"].map(lambda tags: list(tags.items()) if isinstance(tags, dict) else []).explode().dropna()
+   long = pd.DataFrame(pairs.tolist(), index=pairs.index, columns=["key", "value"])
+   # Explicit dtypes: a chunk with no tags at all would otherwise leave both columns object
+   long["key"] = long["key"].astype("string")
+   long["value"] = long["value"].astype("string").fillna("")
+   long["key_lower"] = long["key"].str.lower().astype("category")
+   return long
+def expand_tags(frame, tag_columns=DEFAULT_TAG_COLUMNS):
+   long = long_tags(frame)
+   existing = (long["key"] + ": " + long["value"]).groupby(level=0).agg("; ".join)
+   result = frame.drop(columns=["_tags"])
+   result["Existing Tags"] = existing.reindex(frame.index).fillna("-")
+   wanted = {column.lower(): column for column in tag_columns}
+   selected = long[long["key_lower"].isin(list(wanted))].reset_index(names="row")
+   # An exact-case key wins over other spellings of the same tag on one resource
+   selected["exact"] = selected["key"].isin(list(tag_columns))
+   selected = selected.sort_values(["row", "exact"], ascending=[True, False], kind="stable")
+   selected = selected.drop_duplicates(subset=["row", "key_lower"], keep="first")
+   wide = selected.pivot(index="row", columns="key_lower", values="value")
+   wide.columns = [wanted[str(key)] for key in wide.columns]
+   wide = wide.reindex(index=frame.index, columns=list(tag_columns))
+   for column in tag_columns:
+       result[column] = wide[column].fillna("-")
+   return result
+def compliance_counts(frame, tag_columns=DEFAULT_TAG_COLUMNS):
+   present = frame[list(tag_columns)].ne("-")
+   present["Fully Tagged"] = present.all(axis=1)
+   present["Resources"] = 1
+   keys = [frame["Subscription"], frame["Resource Type"]]
+   return present.groupby(keys).sum().astype(int)
+def compliance_summary(counts, tag_columns=DEFAULT_TAG_COLUMNS):
+   summary = counts.sort_index().astype(int)
+   summary["Compliance %"] = (summary["Fully Tagged"] / summary["Resources"] * 100).round(1)
+   summary = summary.reset_index()
+   columns = ["Subscription", "Resource Type", "Resources"] + [f"{c} Tagged" for c in tag_columns] + ["Fully Tagged", "Compliance %"]
+   summary.columns = ["Subscription", "Resource Type"] + [f"{c} Tagged" for c in tag_columns] + ["Fully Tagged", "Resources", "Compliance %"]
+   return summary[columns]
+def compliance_schema(summary):
+   types = {"Subscription": "string", "Resource Type": "string", "Compliance %": "float"}
+   return [(column, types.get(column, "int")) for column in summary.columns]
+class ComplianceTally:
+   # Compliance counts summed across row chunks, so the summary sheet doesn't
+   # need every resource in one frame.
+   def __init__(self, tag_columns=DEFAULT_TAG_COLUMNS):
+       self.tag_columns = list(tag_columns)
+       self.counts = None
+   def add(self, frame):
+       counts = compliance_counts(frame, self.tag_columns)
+       self.counts = counts if self.counts is None else self.counts.add(counts, fill_value=0)
+   def summary(self):
+       return compliance_summary(self.counts, self.tag_columns)
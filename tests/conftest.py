@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+# Back.py opens its log file in the working directory when imported.
+os.chdir(tempfile.mkdtemp(prefix="azure-reports-tests-"))
+@pytest.fixture(autouse=True)
+def fresh_vm_inventory():
+   from vm_inventory import clear_vm_inventory
+   clear_vm_inventory()
+   yield
+   clear_vm_inventory()
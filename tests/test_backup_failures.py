@@ -0,0 +1,42 @@
+import Back
+from fake_azure import FakeEstate, install
+from snapshot_store import IncompleteRows, SnapshotStore
+from vm_coverage import CoverageIndex
+def test_failed_vault_listing_is_reported_and_not_snapshotted(tmp_path):
+   # Subscription 0 lists its vaults, every later listing fails.
+   estate = FakeEstate(30, vms_per_subscription=10, failures={"vaults.list_by_subscription_id": 1})
+   context = install(estate)
+   store = SnapshotStore(str(tmp_path / "snapshot.db"))
+   rows = list(Back.collect_backup(context, estate.subscriptions, store, max_workers=1))
+   assert not isinstance(rows[0], IncompleteRows) and len(rows[0]) == 8
+   for sub, failed in zip(estate.subscriptions[1:], rows[1:]):
+       assert isinstance(failed, IncompleteRows)
+       assert [row[:4] for row in failed] == [["-", sub.display_name, "-", "Lookup failed"]]
+       assert store.last_sync("backup", sub.subscription_id, Back.SNAPSHOT_ROW_FORMAT) is None
+   assert store.last_sync("backup", estate.subscriptions[0].subscription_id, Back.SNAPSHOT_ROW_FORMAT) is not None
+def test_failed_vault_keeps_other_vaults_rows():
+   # The first vault's protected items list, the second vault's fail.
+   estate = FakeEstate(10, vms_per_subscription=10, failures={"backup_protected_items.list": 1})
+   context = install(estate)
+   [rows] = list(Back.collect_backup_rows(context, estate.subscriptions, max_workers=1))
+   assert isinstance(rows, IncompleteRows) and rows.failures == 1
+   assert {row[6] for row in rows if row[3] != "Lookup failed"} == {"rsv-0"}
+   assert [(row[6], row[2], row[-1]) for row in rows if row[3] == "Lookup failed"] == [("rsv-1", "rg-backup", None)]
+   assert list(Back.backup_report_rows([rows]))[-1][3] == "Lookup failed"
+def test_failed_protected_item_is_a_coverage_gap():
+   # Policies can neither be listed nor fetched, so every protected item fails.
+   estate = FakeEstate(10, vms_per_subscription=10, failures={"backup_policies.list": 0, "protection_policies.get": 0})
+   context = install(estate)
+   [rows] = list(Back.collect_backup_rows(context, estate.subscriptions, max_workers=1))
+   assert rows.failures == 8
+   vm_id = estate.vm_id(estate.subscriptions[0].subscription_id, 1).lower()
+   failed = next(row for row in rows if row[-1] == vm_id)
+   assert failed[:4] == ["vm-1", "Subscription 0", "rg-1", "Lookup failed"]
+   coverage = CoverageIndex([])
+   coverage.add_patch(vm_id, "vm-1", "Subscription 0", "rg-1", "eastus", "Configured with schedule", "mc-1", "Batch 1")
+   list(Back.backup_report_rows([rows], coverage))
+   rows = {row[2]: row for row in coverage.rows()}
+   assert rows["vm-1"][3:] == ["eastus", "-", "rsv-1", "-", "Configured with schedule", "mc-1", "Batch 1", "Backup lookup failed; No tag data"]
+   # Only backup saw the other VMs
+   assert rows["vm-2"][-1] == "Not in VM inventory"
+   assert list(coverage.summary_rows())[0][2] == 0
@@ -0,0 +1,34 @@
+import Back
+from fake_azure import FakeEstate, install
+from snapshot_store import SnapshotStore
+def incremental_run(estate, store, max_age_hours=168):
+   context = install(estate)
+   context.config["snapshotMaxAgeHours"] = max_age_hours
+   estate.calls.clear()
+   return list(Back.collect_backup(context, estate.subscriptions, store, max_workers=2))
+def test_unchanged_subscriptions_reuse_policies_but_relist_protection(tmp_path):
+   estate = FakeEstate(30, vms_per_subscription=10)
+   store = SnapshotStore(str(tmp_path / "snapshot.db"))
+   first = incremental_run(estate, store)
+   assert estate.calls["backup_policies.list"] == 3 * 2
+   # Resource Graph reports no changes, so no policy is read again...
+   second = incremental_run(estate, store)
+   assert second == first
+   assert estate.calls["backup_policies.list"] == estate.calls["protection_policies.get"] == 0
+   # ...while protected items are listed again for every vault.
+   assert estate.calls["backup_protected_items.list"] == 3 * 2
+def test_protection_removed_since_the_last_run_is_reported(tmp_path):
+   estate = FakeEstate(30, vms_per_subscription=10)
+   store = SnapshotStore(str(tmp_path / "snapshot.db"))
+   first = incremental_run(estate, store)
+   estate.is_backed_up = lambda i: i % 5 != 0 and i != 1
+   second = incremental_run(estate, store)
+   assert [row[0] for row in first[0] if row[0] != "vm-1"] == [row[0] for row in second[0]]
+   assert second[1:] == first[1:]
+   assert [row[0] for row in store.load_records("backup", estate.subscriptions[0].subscription_id)] == [row[0] for row in second[0]]
+def test_policies_are_reread_after_the_max_age(tmp_path):
+   estate = FakeEstate(30, vms_per_subscription=10)
+   store = SnapshotStore(str(tmp_path / "snapshot.db"))
+   incremental_run(estate, store, max_age_hours=0)
+   incremental_run(estate, store, max_age_hours=0)
+   assert estate.calls["backup_policies.list"] == 3 * 2
@@ -0,0 +1,52 @@
+import csv
+import patch
+from fake_azure import FakeEstate, install
+from raw_config_cache import RawConfigCache
+from snapshot_store import IncompleteRows, SnapshotStore
+from vm_coverage import CoverageIndex
+def collect(estate, tmp_path, store=None, bulk=True):
+   context = install(estate)
+   raw_configs = RawConfigCache(str(tmp_path / "raw_configs"))
+   return list(patch.collect_patching(context, estate.subscriptions, {}, raw_configs, store, bulk))
+def test_failed_vm_listing_is_reported_and_not_snapshotted(tmp_path):
+   # Subscription 0 lists its VMs (model and status listing), every later listing fails.
+   estate = FakeEstate(30, vms_per_subscription=10, failures={"virtual_machines.list_all": 2})
+   store = SnapshotStore(str(tmp_path / "snapshot.db"))
+   rows = collect(estate, tmp_path, store)
+   assert not isinstance(rows[0], IncompleteRows) and len(rows[0]) == 10
+   for sub, failed in zip(estate.subscriptions[1:], rows[1:]):
+       assert isinstance(failed, IncompleteRows)
+       assert [(row["Subscription Name"], row["VM Name"], row["Update Manager Status"]) for row in failed] == [
+           (sub.display_name, "-", "Lookup failed")
+       ]
+       assert store.last_sync("patching", sub.subscription_id, patch.SNAPSHOT_ROW_FORMAT) is None
+   assert store.last_sync("patching", estate.subscriptions[0].subscription_id, patch.SNAPSHOT_ROW_FORMAT) is not None
+def test_failed_assignment_lookups_are_not_snapshotted(tmp_path):
+   # The bulk assignment listing fails, then the first 3 per-VM lookups succeed.
+   estate = FakeEstate(10, vms_per_subscription=10, failures={
+       "configuration_assignments_within_subscription.list": 0, "configuration_assignments.list_parent": 3
+   })
+   store = SnapshotStore(str(tmp_path / "snapshot.db"))
+   [rows] = collect(estate, tmp_path, store)
+   assert isinstance(rows, IncompleteRows) and rows.failures == 7
+   assert [row["Update Manager Status"] for row in rows].count("Lookup failed") == 7
+   assert store.last_sync("patching", estate.subscriptions[0].subscription_id, patch.SNAPSHOT_ROW_FORMAT) is None
+def test_per_vm_lookups_match_bulk_listing(tmp_path):
+   bulk = collect(FakeEstate(30, vms_per_subscription=10), tmp_path)
+   estate = FakeEstate(30, vms_per_subscription=10, failures={"configuration_assignments_within_subscription.list": 0})
+   fallback = collect(estate, tmp_path)
+   assert fallback == bulk
+   assert estate.calls["configuration_assignments.list_parent"] == 30
+   assert estate.calls["configuration_assignments_within_subscription.list"] == 3
+   unbulked = FakeEstate(30, vms_per_subscription=10)
+   assert collect(unbulked, tmp_path, bulk=False) == bulk
+   assert unbulked.calls["configuration_assignments_within_subscription.list"] == 0
+def test_failed_listing_row_is_written_but_not_joined(tmp_path):
+   estate = FakeEstate(20, vms_per_subscription=10, failures={"virtual_machines.list_all": 2})
+   coverage = CoverageIndex(["Owner"])
+   output = str(tmp_path / "Patching-Sheet.csv")
+   patch.export_patching(collect(estate, tmp_path), output, "csv", coverage)
+   with open(output, encoding="utf-8-sig") as f:
+       rows = list(csv.DictReader(f))
+   assert len(rows) == 11 and rows[-1]["Update Manager Status"] == "Lookup failed"
+   assert len(coverage.patching) == 10
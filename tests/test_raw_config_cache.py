@@ -0,0 +1,61 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from raw_config_cache import INDEX_FILE, RawConfigCache
+def vm_id(subscription, i):
+   return f"/subscriptions/sub-{subscription}/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/vm-{i}"
+def config_id(subscription):
+   return f"/subscriptions/sub-{subscription}/resourceGroups/rg/providers/Microsoft.Maintenance/maintenanceConfigurations/mc"
+def record_shard(path, shard, vm_count=50):
+   # Like a --shards worker: its own cache, saving after every VM.
+   cache = RawConfigCache(path)
+   cache.config_dict(config_id(shard), {"name": f"mc-{shard}"})
+   for i in range(vm_count):
+       cache.record(vm_id(shard, i), f"vm-{i}", config_id(shard))
+       cache.save()
+def read_index(path):
+   with open(os.path.join(path, INDEX_FILE), encoding="utf-8") as f:
+       return json.load(f)
+def test_concurrent_shard_saves_keep_every_entry(tmp_path):
+   path = str(tmp_path)
+   with ProcessPoolExecutor(max_workers=4) as executor:
+       list(executor.map(record_shard, [path] * 4, range(4)))
+   index = read_index(path)
+   assert len(index["configs"]) == 4
+   assert len(index["vms"]) == 4 * 50
+   assert not [name for name in os.listdir(path) if name.endswith(".tmp")]
+def test_save_keeps_entries_written_by_others(tmp_path):
+   path = str(tmp_path)
+   first, second = RawConfigCache(path), RawConfigCache(path)
+   for cache, shard in ((first, 0), (second, 1)):
+       cache.config_dict(config_id(shard), {"name": f"mc-{shard}"})
+       cache.record(vm_id(shard, 0), "vm-0", config_id(shard))
+   first.save()
+   second.save()
+   first.forget(vm_id(0, 0))
+   first.save()
+   assert list(read_index(path)["vms"]) == [vm_id(1, 0).lower()]
+def test_prune_drops_unlisted_vms_of_the_subscription(tmp_path):
+   cache = RawConfigCache(str(tmp_path))
+   for shard in (0, 1):
+       cache.config_dict(config_id(shard), {"name": f"mc-{shard}"})
+       for i in range(3):
+           cache.record(vm_id(shard, i), f"vm-{i}", config_id(shard))
+   assert cache.prune("SUB-0", {vm_id(0, 1).lower()}) == 2
+   cache.save()
+   assert sorted(read_index(str(tmp_path))["vms"]) == sorted(
+       [vm_id(0, 1).lower()] + [vm_id(1, i).lower() for i in range(3)]
+   )
+def write_shared_configs(path, count=300):
+   # Every worker stores the same configurations, like one central schedule
+   # assigned across subscriptions in different shards.
+   cache = RawConfigCache(path)
+   for i in range(count):
+       cache.config_dict(f"/subscriptions/shared/providers/Microsoft.Maintenance/maintenanceConfigurations/mc-{i}", {"name": f"mc-{i}"})
+   return cache.written + cache.reused
+def test_shards_writing_the_same_configs(tmp_path):
+   path = str(tmp_path)
+   with ProcessPoolExecutor(max_workers=4) as executor:
+       assert list(executor.map(write_shared_configs, [path] * 4)) == [300] * 4
+   assert len([name for name in os.listdir(path) if name.endswith(".json")]) == 300
+   assert not [name for name in os.listdir(path) if name.endswith(".tmp")]
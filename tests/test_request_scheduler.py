@@ -0,0 +1,12 @@
+from request_scheduler import RESOURCE_GRAPH_BUCKET, TENANT_BUCKET, RequestScheduler, bucket_key
+ARM = "https://management.azure.com"
+def test_requests_are_bucketed_by_scope():
+   assert bucket_key(f"{ARM}/subscriptions/ABC-1/resources?api-version=2021-04-01") == "abc-1"
+   assert bucket_key(f"{ARM}/providers/Microsoft.ResourceGraph/resources?api-version=2021-03-01") == RESOURCE_GRAPH_BUCKET
+   assert bucket_key(f"{ARM}/subscriptions?api-version=2022-12-01") == TENANT_BUCKET
+def test_resource_graph_has_its_own_budget():
+   scheduler = RequestScheduler.from_config({"armBucketSize": 100, "graphBucketSize": 5, "graphRefillPerSecond": 1})
+   assert scheduler.bucket(RESOURCE_GRAPH_BUCKET).capacity == 5
+   assert scheduler.bucket(TENANT_BUCKET).capacity == 100
+   scheduler.bucket(RESOURCE_GRAPH_BUCKET).block_for(60)
+   assert scheduler.bucket("abc-1").blocked_until == 0.0
@@ -0,0 +1,30 @@
+import os
+import pytest
+from row_pipeline import sink_for, write_table
+def failing_rows(count):
+   for i in range(count):
+       yield [f"vm-{i}", i]
+   raise RuntimeError("collector failed")
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "xlsx"])
+def test_failed_collection_leaves_no_report(tmp_path, fmt):
+   if fmt == "parquet":
+       pytest.importorskip("pyarrow")
+   path = str(tmp_path / f"report.{fmt}")
+   sink = sink_for(path)
+   with pytest.raises(RuntimeError):
+       write_table(sink, "Sheet1", ["Name", "Count"], failing_rows(20000), ["string", "int"])
+   assert os.listdir(str(tmp_path)) == []
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_extra_tables_are_published_next_to_the_main_file(tmp_path, fmt):
+   if fmt == "parquet":
+       pytest.importorskip("pyarrow")
+   sink = sink_for(str(tmp_path / f"report.{fmt}"))
+   assert write_table(sink, "Sheet1", ["Name"], [["a"], ["b"]], ["string"]) == 2
+   write_table(sink, "Tag Compliance", ["Name"], [["c"]], ["string"])
+   sink.close()
+   assert sorted(os.listdir(str(tmp_path))) == [f"report.{fmt}", f"report_tag_compliance.{fmt}"]
+def test_unknown_column_type_is_rejected_before_writing(tmp_path):
+   sink = sink_for(str(tmp_path / "report.csv"))
+   with pytest.raises(ValueError, match="integer"):
+       write_table(sink, "Sheet1", ["Name", "Count"], [["a", 1]], ["string", "integer"])
+   assert os.listdir(str(tmp_path)) == []
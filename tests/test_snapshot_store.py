@@ -0,0 +1,48 @@
+import pytest
+import sqlite3
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from snapshot_store import SnapshotStore, collect_with_snapshot, plan_refresh
+SUBSCRIPTION = SimpleNamespace(subscription_id="00000000-0000-0000-0000-000000000000", display_name="Subscription 0")
+ROWS = [
+   {"VM Name": "vm-1", "_start_datetime": datetime(2024, 1, 1, 2, 30), "_duration_minutes": 210, "_id": "/subscriptions/x/vm-1"},
+   {"VM Name": "vm-2", "_start_datetime": None, "_duration_minutes": None, "_id": "/subscriptions/x/vm-2"}
+]
+def save(store, rows, row_format):
+   return store.save_records("patching", SUBSCRIPTION.subscription_id, "vm", ((row["VM Name"], row) for row in rows),
+                             datetime.now(timezone.utc), row_format)
+def test_rows_round_trip_as_json(tmp_path):
+   store = SnapshotStore(str(tmp_path / "snapshot.db"))
+   save(store, ROWS, 1)
+   assert store.load_records("patching", SUBSCRIPTION.subscription_id) == ROWS
+   payload = store._conn.execute("SELECT payload FROM records LIMIT 1").fetchone()[0]
+   assert payload.startswith("{")
+def test_other_row_format_forces_full_refresh(tmp_path):
+   store = SnapshotStore(str(tmp_path / "snapshot.db"))
+   save(store, ROWS, 1)
+   assert store.last_sync("patching", SUBSCRIPTION.subscription_id, 1) is not None
+   # A mismatch never reaches the resourcechanges query, so no context is needed.
+   assert plan_refresh(store, "patching", None, [SUBSCRIPTION], row_format=2) == {SUBSCRIPTION.subscription_id}
+   fetched = []
+   rows = list(collect_with_snapshot(
+       store, "patching", "vm", None, [SUBSCRIPTION],
+       lambda subs: (fetched.append(sub) or ROWS[:1] for sub in subs),
+       record_key=lambda row: row["VM Name"], row_format=2
+   ))
+   assert fetched == [SUBSCRIPTION] and rows == [ROWS[:1]]
+   assert store.last_sync("patching", SUBSCRIPTION.subscription_id, 2) is not None
+def test_store_without_row_formats_is_migrated_and_refetched(tmp_path):
+   path = str(tmp_path / "snapshot.db")
+   with sqlite3.connect(path) as conn:
+       conn.execute("CREATE TABLE syncs (collector TEXT, subscription_id TEXT, synced_at TEXT, "
+                    "PRIMARY KEY (collector, subscription_id))")
+       conn.execute("INSERT INTO syncs VALUES (?, ?, ?)",
+                    ("patching", SUBSCRIPTION.subscription_id, datetime.now(timezone.utc).isoformat()))
+   store = SnapshotStore(path)
+   assert store.last_sync("patching", SUBSCRIPTION.subscription_id, 1) is None
+def test_partials_with_other_row_format_are_rejected(tmp_path):
+   from sharding import read_partials, write_partial
+   write_partial(str(tmp_path), "patching", (0, 1), [SUBSCRIPTION], lambda subs: (ROWS for _ in subs), row_format=1)
+   assert list(read_partials(str(tmp_path), "patching", row_format=1)) == [ROWS]
+   with pytest.raises(ValueError):
+       read_partials(str(tmp_path), "patching", row_format=2)
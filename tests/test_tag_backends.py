@@ -0,0 +1,41 @@
+import Tag
+from fake_azure import FakeEstate, install
+def collect(estate, backend, subscriptions=None):
+   context = install(estate)
+   return list(Tag.collect_resources(context, subscriptions or estate.subscriptions, backend))
+def test_graph_and_arm_backends_yield_the_same_rows():
+   # 7 resources per page, so every subscription spans several skip tokens
+   # and most pages straddle two subscriptions.
+   estate = FakeEstate(50, vms_per_subscription=10, page_size=7, graph_page_size=7)
+   graph = collect(estate, "graph")
+   arm = collect(estate, "arm")
+   assert estate.calls["resourcegraph.resources"] == 22
+   assert len(graph) == len(arm) == 5
+   for graph_rows, arm_rows in zip(graph, arm):
+       assert len(graph_rows) == 30
+       assert graph_rows == arm_rows
+def test_graph_failure_falls_back_for_remaining_subscriptions():
+   # The 6th page fails after 35 rows: subscription 0 (30 resources) has been
+   # yielded and subscription 1 is half read, so listing resumes at subscription 1.
+   estate = FakeEstate(50, vms_per_subscription=10, page_size=7, graph_page_size=7,
+                       failures={"resourcegraph.resources": 5})
+   rows = collect(estate, "graph")
+   assert rows == collect(FakeEstate(50, vms_per_subscription=10), "arm")
+   assert estate.calls["resourcegraph.resources"] == 6
+   # Only subscriptions 1-4 were listed again, at 5 pages of 7 resources each.
+   assert estate.calls["resources.list"] == 4 * 5
+def test_resource_type_from_graph_rows():
+   rg = "/subscriptions/sub-0/resourceGroups/rg-0"
+   vm = f"{rg}/providers/Microsoft.Compute/virtualMachines/vm-0"
+   assert Tag.resource_type_from_id(vm, "microsoft.compute/virtualmachines") == "Microsoft.Compute/virtualMachines"
+   # Child resources name every type segment
+   database = f"{rg}/providers/Microsoft.Sql/servers/sql-0/databases/db-0"
+   assert Tag.resource_type_from_id(database, "microsoft.sql/servers/databases") == "Microsoft.Sql/servers/databases"
+   # Extension resources take their type from the last provider
+   extension = f"{vm}/providers/Microsoft.Insights/diagnosticSettings/logs"
+   assert Tag.resource_type_from_id(extension, "microsoft.insights/diagnosticsettings") == "Microsoft.Insights/diagnosticSettings"
+   # A lower-cased ID or an unexpected shape keeps Graph's type
+   assert Tag.resource_type_from_id(vm.lower(), "microsoft.compute/virtualmachines") == "microsoft.compute/virtualmachines"
+   assert Tag.resource_type_from_id(f"{rg}/providers/Microsoft.Web/sites/app/slots", "microsoft.web/sites") == "microsoft.web/sites"
+   assert Tag.resource_type_from_id("/subscriptions/sub-0/resourceGroups/rg-0", "microsoft.resources/resourcegroups") == \
+       "microsoft.resources/resourcegroups"
@@ -0,0 +1,25 @@
+import csv
+import Tag
+from tag_schema import DEFAULT_TAG_COLUMNS, ComplianceTally
+def nic(i, tags=None):
+   return Tag.tagging_row(
+       f"/subscriptions/sub-0/resourceGroups/rg/providers/Microsoft.Network/networkInterfaces/nic-{i}",
+       f"nic-{i}", "Microsoft.Network/networkInterfaces", "eastus", tags, "Subscription 0"
+   )
+def test_untagged_chunk_gets_placeholders():
+   tally = ComplianceTally(DEFAULT_TAG_COLUMNS)
+   rows = list(Tag.tag_report_rows([nic(i) for i in range(10)], DEFAULT_TAG_COLUMNS, tally))
+   assert rows[0] == ("nic-0", "Microsoft.Network/networkInterfaces", "rg", "eastus", "Subscription 0", "-", "-", "-", "-", "-", "-")
+   assert tally.summary()[["Resources", "Fully Tagged"]].values.tolist() == [[10, 0]]
+def test_untagged_chunk_next_to_tagged_one(monkeypatch):
+   monkeypatch.setattr(Tag, "TAG_CHUNK_ROWS", 5)
+   resources = [nic(i) for i in range(5)] + [nic(5, {"owner": "team-a", "Environment": "prod"})]
+   rows = list(Tag.tag_report_rows(resources, DEFAULT_TAG_COLUMNS, ComplianceTally(DEFAULT_TAG_COLUMNS)))
+   assert rows[4][5:] == ("-",) * 6
+   assert rows[5][5:] == ("owner: team-a; Environment: prod", "prod", "-", "team-a", "-", "-")
+def test_export_of_untagged_resources(tmp_path):
+   output = str(tmp_path / "Tagging-Sheet.csv")
+   Tag.export_tagging([[nic(i) for i in range(10)]], DEFAULT_TAG_COLUMNS, output, "csv")
+   with open(output, encoding="utf-8-sig") as f:
+       rows = list(csv.reader(f))
+   assert len(rows) == 11 and rows[1][5:] == [""] * 6
@@ -0,0 +1,29 @@
+from fake_azure import FakeEstate, install
+from vm_inventory import expire_vm_inventory, load_vm_inventory, lookup_vm
+import Back
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+def test_inventory_merges_model_and_instance_view():
+   estate = FakeEstate(6, vms_per_subscription=6)
+   context = install(estate)
+   inventory = load_vm_inventory(context.credential, SUBSCRIPTION, **context.client_kwargs())
+   vm = inventory[estate.vm_id(SUBSCRIPTION, 1).lower()]
+   assert (vm["os_type"], vm["image_offer"]) == ("Linux", "ubuntu-24_04-lts")
+   assert (vm["os_version"], vm["status"]) == ("ubuntu 24.04", "running")
+   assert estate.calls["virtual_machines.list_all"] == 2
+def test_failed_listing_is_cached_until_expired():
+   estate = FakeEstate(20, vms_per_subscription=20, failures={"virtual_machines.list_all": 0})
+   context = install(estate)
+   for i in range(20):
+       assert lookup_vm(context.credential, estate.vm_id(SUBSCRIPTION, i), **context.client_kwargs()) is None
+   assert estate.calls["virtual_machines.list_all"] == 1
+   expire_vm_inventory(0)
+   estate.failures.clear()
+   assert lookup_vm(context.credential, estate.vm_id(SUBSCRIPTION, 3), **context.client_kwargs())["name"] == "vm-3"
+def test_backup_falls_back_to_one_get_per_vm_when_listing_fails():
+   estate = FakeEstate(20, vms_per_subscription=20, failures={"virtual_machines.list_all": 0})
+   context = install(estate)
+   rows = [row for rows in Back.collect_backup_rows(context, estate.subscriptions, 4) for row in rows]
+   assert len(rows) == 16
+   assert estate.calls["virtual_machines.list_all"] == 1
+   assert estate.calls["virtual_machines.get"] == 16
+   assert all(row[4] != "-" for row in rows)
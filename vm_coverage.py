@@ -0,0 +1,119 @@
+import logging
+from vm_inventory import normalize_id
+from row_pipeline import output_path, sink_for, table_schema, write_table
+# Cross-report join: the tagging, backup and patching reports feed the rows
+# they write into one index keyed by normalized resource ID, and the coverage
+# report is a single pass over those hash tables once all three have run.
+DEFAULT_COVERAGE_FILE = "Coverage-Sheet.xlsx"
+SOURCES = ("tagging", "backup", "patching")
+VM_TYPE = "microsoft.compute/virtualmachines"
+SCHEDULED = "Configured with schedule"
+SUMMARY_COLUMNS = [
+   ("Subscription", "string"), ("VMs", "int"), ("Backed Up", "int"), ("Patch Schedule", "int"),
+   ("Fully Tagged", "int"), ("Fully Covered", "int"), ("Coverage %", "float")
+]
+class CoverageIndex:
+   def __init__(self, tag_columns):
+       self.tag_columns = list(tag_columns)
+       # normalized resource ID -> the few fields each report contributes
+       self.tags = {}
+       self.backup = {}
+       self.patching = {}
+       self.finished = set()
+       self.totals = {}
+   def add_tags(self, frame):
+       # frame: one expanded tag chunk, still carrying the _id column
+       vms = frame[frame["Resource Type"].str.lower() == VM_TYPE]
+       columns = ["_id", "Name", "Resource Group", "Location", "Subscription", *self.tag_columns]
+       for resource_id, name, resource_group, location, subscription, *tags in vms[columns].itertuples(index=False, name=None):
+           self.tags[normalize_id(resource_id)] = (name, resource_group, location, subscription, tuple(tags))
+   def add_backup(self, resource_id, name, subscription, resource_group, vault, policy, lookup_failed=False):
+       key = normalize_id(resource_id)
+       if lookup_failed and key in self.backup:
+           # Another vault already reported this VM
+           return
+       self.backup[key] = (name, subscription, resource_group, vault, policy, lookup_failed)
+   def add_patch(self, resource_id, name, subscription, resource_group, location, status, schedule, batch):
+       self.patching[normalize_id(resource_id)] = (name, subscription, resource_group, location, status, schedule, batch)
+   def finish(self, source):
+       self.finished.add(source)
+   def missing(self):
+       return [source for source in SOURCES if source not in self.finished]
+   def columns(self):
+       return [
+           ("Subscription", "string"), ("Resource Group", "string"), ("VM Name", "string"), ("Location", "string"),
+           *((column, "string") for column in self.tag_columns),
+           ("Backed Up", "bool"), ("RSV", "string"), ("Backup Policy", "string"),
+           ("Update Manager Status", "string"), ("Maintenance Schedule", "string"), ("Batch", "int"), ("Gaps", "string")
+       ]
+   def vm_ids(self):
+       # Tagging order first, then VMs only the patching or backup report saw.
+       yield from self.tags
+       yield from (vm_id for vm_id in self.patching if vm_id not in self.tags)
+       yield from (vm_id for vm_id in self.backup if vm_id not in self.tags and vm_id not in self.patching)
+   def rows(self):
+       self.totals = {}
+       for vm_id in self.vm_ids():
+           tagged = self.tags.get(vm_id)
+           backup = self.backup.get(vm_id)
+           patch = self.patching.get(vm_id)
+           if tagged:
+               name, resource_group, location, subscription, tags = tagged
+           elif patch:
+               name, subscription, resource_group, location = patch[:4]
+               tags = ("-",) * len(self.tag_columns)
+           else:
+               name, subscription, resource_group = backup[:3]
+               location = "-"
+               tags = ("-",) * len(self.tag_columns)
+           status, schedule, batch = patch[4:] if patch else ("-", "-", "-")
+           backup_failed = bool(backup) and backup[5]
+           gaps = []
+           if not tagged and not patch:
+               gaps.append("Not in VM inventory")
+           else:
+               if not backup:
+                   gaps.append("No backup")
+               elif backup_failed:
+                   gaps.append("Backup lookup failed")
+               if not patch:
+                   gaps.append("No patch data")
+               elif status != SCHEDULED:
+                   gaps.append("Patch lookup failed" if status == "Lookup failed" else "No patch schedule")
+               missing_tags = [column for column, value in zip(self.tag_columns, tags) if value == "-"]
+               if not tagged:
+                   gaps.append("No tag data")
+               elif missing_tags:
+                   gaps.append(f"Missing tags: {', '.join(missing_tags)}")
+           total = self.totals.setdefault(subscription, [0, 0, 0, 0, 0])
+           total[0] += 1
+           total[1] += bool(backup) and not backup_failed
+           total[2] += status == SCHEDULED
+           total[3] += bool(tagged) and "-" not in tags
+           total[4] += not gaps
+           yield [
+               subscription, resource_group, name, location, *tags,
+               "-" if backup_failed else "Yes" if backup else "No", backup[3] if backup else "-", backup[4] if backup else "-",
+               status, schedule, batch, "; ".join(gaps) or "-"
+           ]
+   def summary_rows(self):
+       # Per-subscription counts gathered while rows() was consumed
+       for subscription in sorted(self.totals, key=str.lower):
+           vms, backed_up, scheduled, fully_tagged, covered = self.totals[subscription]
+           yield [subscription, vms, backed_up, scheduled, fully_tagged, covered, round(covered / vms * 100, 1)]
+def write_coverage(coverage, output_file=DEFAULT_COVERAGE_FILE, fmt="xlsx"):
+   missing = coverage.missing()
+   if missing:
+       logging.warning(f"⚠️ Coverage report skipped: no complete {', '.join(missing)} data in this run")
+       print(f"⚠️ Coverage report skipped: no complete {', '.join(missing)} data in this run")
+       return
+   output_file = output_path(output_file, fmt)
+   columns = coverage.columns()
+   sink = sink_for(output_file)
+   headers, types = table_schema(fmt, [name for name, _ in columns], columns)
+   count = write_table(sink, "Coverage", headers, coverage.rows(), types)
+   headers, types = table_schema(fmt, [name for name, _ in SUMMARY_COLUMNS], SUMMARY_COLUMNS)
+   write_table(sink, "Coverage Summary", headers, coverage.summary_rows(), types)
+   sink.close()
+   logging.info(f"✅ Coverage report for {count} VMs exported to {output_file} 🎉")
+   print(f"✅ Coverage report for {count} VMs exported to {output_file} 🎉")
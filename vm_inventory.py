@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+# Shared per-subscription VM index, loaded with paged list_all walks and
+# looked up by normalized resource ID from Back.py and patch.py.
+_inventories = {}
+_loaded_at = {}
+_locks = {}
+_locks_guard = threading.Lock()
+def normalize_id(rid: str) -> str:
+   return rid.lower().replace(" ", "") if rid else ""
+def instance_summary(vm):
+   os_version = "-"
+   status = "-"
+   instance_view = getattr(vm, "instance_view", None)
+   if instance_view:
+       os_name = getattr(instance_view, "os_name", None)
+       os_ver = getattr(instance_view, "os_version", None)
+       if os_name and os_ver:
+           os_version = f"{os_name} {os_ver}"
+       for s in getattr(instance_view, "statuses", None) or []:
+           code = getattr(s, "code", "") or ""
+           if code.startswith("PowerState/"):
+               status = code.split("/")[-1]
+   return {"os_version": os_version, "status": status}
+def summarize_vm(vm):
+   storage_profile = getattr(vm, "storage_profile", None)
+   os_disk = getattr(storage_profile, "os_disk", None)
+   image_reference = getattr(storage_profile, "image_reference", None)
+   return {
+       "id": vm.id,
+       "name": vm.name,
+       "resource_group": vm.id.split('/')[4],
+       "location": vm.location,
+       "os_type": getattr(os_disk, "os_type", None) or "-",
+       "image_offer": getattr(image_reference, "offer", None) or "-",
+       **instance_summary(vm)
+   }
+def load_vm_inventory(credential, subscription_id, compute_client=None, **client_kwargs):
+   # Returns None if the subscription's VMs could not be listed. The failure is
+   # cached like a result, so callers fall back once instead of relisting per VM.
+   key = subscription_id.lower()
+   with _locks_guard:
+       lock = _locks.setdefault(key, threading.Lock())
+   with lock:
+       if key in _inventories:
+           return _inventories[key]
+       if compute_client is None:
+           from azure.mgmt.compute import ComputeManagementClient
+           compute_client = ComputeManagementClient(credential, subscription_id, **client_kwargs)
+       try:
+           # The plain listing carries the VM model (OS disk, image); the
+           # status_only one carries the instance view (power state, OS version).
+           inventory = {normalize_id(vm.id): summarize_vm(vm) for vm in compute_client.virtual_machines.list_all()}
+           for vm in compute_client.virtual_machines.list_all(status_only="true"):
+               summary = inventory.get(normalize_id(vm.id))
+               if summary:
+                   summary.update(instance_summary(vm))
+           logging.info(f"Loaded {len(inventory)} VMs for subscription '{subscription_id}'")
+       except Exception as e:
+           logging.warning(f"Could not list VMs for subscription '{subscription_id}': {e}")
+           inventory = None
+       with _locks_guard:
+           _inventories[key] = inventory
+           _loaded_at[key] = time.monotonic()
+       return inventory
+def lookup_vm(credential, resource_id, **client_kwargs):
+   parts = normalize_id(resource_id).split('/')
+   if len(parts) < 3:
+       return None
+   inventory = load_vm_inventory(credential, parts[2], **client_kwargs)
+   if inventory is None:
+       return None
+   return inventory.get(normalize_id(resource_id), {})
+def clear_vm_inventory():
+   with _locks_guard:
+       _inventories.clear()
+       _loaded_at.clear()
+def expire_vm_inventory(max_age_seconds):
+   # For long-running processes: inventories (and cached listing failures) older
+   # than this are listed again on next use.
+   cutoff = time.monotonic() - max_age_seconds
+   with _locks_guard:
+       for key in [key for key, loaded in _loaded_at.items() if loaded < cutoff]:
+           _inventories.pop(key, None)
+           _loaded_at.pop(key, None)